@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from text_pipeline import WORD, STOPWORDS, QUESTION_WORDS
+
+DEFAULT_ENTRIES = 4096
+DEFAULT_TTL = 600
+ENTRY_OVERHEAD = 350  # per single-answer question; see benchmarks/bench_memory_overhead.py
+
+
+def canonical_key(text):
+    # "What is a Volcano?" and "volcano, what is it" ask the same thing.
+    # Short words go too, so "tell me about it" stays uncached: its
+    # answer depends on the conversation, not on the words.
+    words = {w for w in WORD.findall(text.lower())
+             if w not in STOPWORDS and w not in QUESTION_WORDS and len(w) > 2}
+    return ' '.join(sorted(words))
+
+
+class Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.answer = None
+        self.failed = False
+
+
+class AnswerCache:
+    # Whole answers by canonical input, in front of the fetch pipeline. Each
+    # key keeps up to 'variants' different answers; accept(answer) decides
+    # whether a caller may have a cached one (the repeat-suppression hook),
+    # and when it turns all of them down the pipeline runs and adds another.
+    # Identical questions arriving together share one pipeline run.
+    def __init__(self, max_entries=DEFAULT_ENTRIES, ttl=DEFAULT_TTL, variants=3, keep=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.variants = variants
+        self.keep = keep  # keep(answer) -> False for answers not worth caching
+        self.entries = OrderedDict()  # key -> [expires, answers, seconds the pipeline took]
+        self.flights = {}             # key -> Flight
+        self.lock = threading.Lock()
+        self.metrics = Counter()
+        self.saved = 0.0
+
+    def _lookup(self, key, accept):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self.entries[key]
+            self.metrics["expired"] += 1
+            return None
+        self.entries.move_to_end(key)
+        for answer in entry[1]:
+            if accept is None or accept(answer):
+                self.metrics["hits"] += 1
+                self.saved += entry[2]
+                return answer
+        self.metrics["variety_misses"] += 1
+        return None
+
+    def _store(self, key, answer, seconds):
+        if self.keep is not None and not self.keep(answer):
+            return
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                entry = self.entries[key] = [0, [], seconds]
+            if answer not in entry[1]:
+                entry[1] = (entry[1] + [answer])[-self.variants:]
+            # Expiry counts from the newest answer; the cost is smoothed
+            entry[0] = time.monotonic() + self.ttl
+            entry[2] = 0.8 * entry[2] + 0.2 * seconds
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.metrics["evicted"] += 1
+
+    def get_or_compute(self, text, compute, accept=None):
+        key = canonical_key(text)
+        if not key:
+            with self.lock:
+                self.metrics["uncacheable"] += 1
+            return compute()
+
+        with self.lock:
+            answer = self._lookup(key, accept)
+            if answer is not None:
+                return answer
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.flights[key] = Flight()
+                self.metrics["misses"] += 1
+            else:
+                self.metrics["coalesced"] += 1
+
+        if not leader:
+            flight.done.wait()
+            if not flight.failed and (accept is None or accept(flight.answer)):
+                return flight.answer
+            return compute()  # its run failed, or this conversation just had that answer
+
+        start = time.monotonic()
+        try:
+            flight.answer = compute()
+        except BaseException:
+            flight.failed = True
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        self._store(key, flight.answer, time.monotonic() - start)
+        if accept is not None:
+            accept(flight.answer)  # lets a history hook record the fresh answer too
+        return flight.answer
+
+    def _entry_bytes(self, key, entry):
+        return len(key) + sum(len(answer) + ENTRY_OVERHEAD for answer in entry[1])
+
+    def memory_bytes(self):
+        with self.lock:
+            return sum(self._entry_bytes(key, entry) for key, entry in self.entries.items())
+
+    def shrink(self, fraction):
+        # Forgets the least recently used 'fraction' of the questions
+        freed = 0
+        with self.lock:
+            for _ in range(int(len(self.entries) * fraction)):
+                freed += self._entry_bytes(*self.entries.popitem(last=False))
+                self.metrics["evicted"] += 1
+        return freed
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+            stats["entries"] = len(self.entries)
+            # A variety miss runs the pipeline, so it is counted as a miss as well
+            lookups = stats.get("hits", 0) + stats.get("misses", 0) + stats.get("coalesced", 0)
+            stats["hit_rate"] = round(stats.get("hits", 0) / lookups, 3) if lookups else 0
+            stats["saved_s"] = round(self.saved, 3)
+        return stats
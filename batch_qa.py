@@ -0,0 +1,215 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import client_ai4
+from client_ai4 import (extract_keywords, fetch_wikipedia, fetch_duckduckgo, fetch_wikidata,
+                        FALLBACK_RESPONSE)
+from parse_pool import ParsePool
+from text_pipeline import score_sentences, rank_sentences
+
+SOURCES = [('wikipedia', fetch_wikipedia), ('duckduckgo', fetch_duckduckgo), ('wikidata', fetch_wikidata)]
+
+
+class KeywordFetcher:
+    # One fetch per (source, keyword) for the whole batch: questions sharing
+    # a keyword wait on the same future, and finished ones stay memoized.
+    # Past 'memo' keywords the oldest are dropped; the fetch cache still has them.
+    def __init__(self, executor, memo=5000):
+        self.executor = executor
+        self.memo = memo
+        self.futures = OrderedDict()  # (source, word) -> future
+        self.lock = threading.Lock()
+        self.requested = 0
+        self.fetched = 0
+
+    def get(self, source, fetch, word):
+        key = (source, word)
+        with self.lock:
+            self.requested += 1
+            future = self.futures.get(key)
+            if future is None:
+                future = self.futures[key] = self.executor.submit(fetch, word)
+                self.fetched += 1
+                while len(self.futures) > self.memo:
+                    self.futures.popitem(last=False)
+            else:
+                self.futures.move_to_end(key)
+        return future
+
+
+def answer_question(question, fetcher, timeout):
+    # The client's pipeline without its conversation state: no pronoun
+    # resolution and no repeat suppression, so every line stands alone
+    start = time.monotonic()
+    keywords = extract_keywords(question)
+    futures = [fetcher.get(name, fetch, word) for word in keywords for name, fetch in SOURCES]
+    done, _ = wait(futures, timeout=timeout)
+    scored = []
+    # Submission order, so equal scores rank the same as in the client
+    for future in futures:
+        if future in done and future.exception() is None:
+            scored.extend(score_sentences(future.result(), keywords))
+    candidates = rank_sentences(scored)
+    return {"question": question, "keywords": keywords,
+            "answer": candidates[0][:500] if candidates else FALLBACK_RESPONSE,
+            "ms": round((time.monotonic() - start) * 1000, 1)}
+
+
+def read_questions(f, skip):
+    # Line numbers are the record indexes, so a resumed run matches them up
+    for index, line in enumerate(f):
+        question = line.strip()
+        if question and index not in skip:
+            yield index, question
+
+
+def resume_output(path):
+    # The output is the checkpoint: every complete line is a finished
+    # question. A line cut off by the interruption is dropped, and so are
+    # questions that failed, which get asked again.
+    done = set()
+    if not os.path.exists(path):
+        return done
+    kept = []
+    failed = False
+    with open(path, 'rb+') as f:
+        good = 0
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            try:
+                record = json.loads(line)
+                index = record["index"]
+            except (ValueError, KeyError):
+                break
+            good += len(line)
+            if "error" in record:
+                failed = True
+                continue
+            done.add(index)
+            kept.append(line)
+        f.truncate(good)
+    if failed:
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.writelines(kept)
+        os.replace(tmp_path, path)
+    return done
+
+
+def run_batch(questions, out, workers=16, fetch_workers=32, order='input', timeout=30,
+              save=False, report_every=5):
+    fetch_executor = ThreadPoolExecutor(max_workers=fetch_workers)
+    fetcher = KeywordFetcher(fetch_executor)
+    executor = ThreadPoolExecutor(max_workers=workers)
+    running = {}       # future -> (index, question)
+    finished = {}      # index -> record, waiting for earlier ones in input order
+    queued = deque()   # indexes in input order
+    answered = 0
+    started = last_report = time.monotonic()
+
+    def emit(record):
+        nonlocal answered
+        out.write(json.dumps(record, ensure_ascii=False) + '\n')
+        out.flush()
+        answered += 1
+        if save and record.get("answer", FALLBACK_RESPONSE) != FALLBACK_RESPONSE:
+            client_ai4.corpus_log.append([record["question"], {"meaning": record["question"]}],
+                                         [record["answer"], {"meaning": record["answer"]}])
+
+    def report(final=False):
+        elapsed = time.monotonic() - started
+        deduplicated = fetcher.requested - fetcher.fetched
+        print(f"{'Done: ' if final else ''}{answered} answered in {elapsed:.0f}s "
+              f"({answered / elapsed if elapsed else 0:.1f} questions/sec), "
+              f"{fetcher.fetched} fetches, {deduplicated} shared", file=sys.stderr)
+
+    questions = iter(questions)
+    exhausted = False
+    try:
+        while True:
+            # Only a few questions per worker are in flight, however long the input
+            while not exhausted and len(running) < workers * 2:
+                try:
+                    index, question = next(questions)
+                except StopIteration:
+                    exhausted = True
+                    break
+                running[executor.submit(answer_question, question, fetcher, timeout)] = (index, question)
+                if order == 'input':
+                    queued.append(index)
+            if not running:
+                break
+
+            done, _ = wait(list(running), timeout=report_every, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, question = running.pop(future)
+                try:
+                    record = dict(index=index, **future.result())
+                except Exception as e:
+                    record = {"index": index, "question": question, "error": str(e)}
+                if order == 'completion':
+                    emit(record)
+                else:
+                    finished[index] = record
+            while queued and queued[0] in finished:
+                emit(finished.pop(queued.popleft()))
+
+            now = time.monotonic()
+            if now - last_report >= report_every:
+                if out is not sys.stdout:
+                    os.fsync(out.fileno())
+                report()
+                last_report = now
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        fetch_executor.shutdown(wait=False, cancel_futures=True)
+    report(final=True)
+    return answered
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Answer a file of questions, one per line, and write JSONL results.')
+    parser.add_argument('questions', nargs='?', default='-', help='Question file (default: stdin)')
+    parser.add_argument('-o', '--output', default='-', help='JSONL output (default: stdout)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Skip questions already in the output file and append the rest')
+    parser.add_argument('--order', choices=('input', 'completion'), default='input',
+                        help='Write results in input order, or as soon as each is done')
+    parser.add_argument('--workers', type=int, default=16, help='Questions answered at once')
+    parser.add_argument('--fetch-workers', type=int, default=32, help='Concurrent source fetches')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='Seconds a question waits for its fetches (default: 30)')
+    parser.add_argument('--parse-workers', type=int,
+                        help='Processes parsing fetched articles (default: one per CPU but one)')
+    parser.add_argument('--save', action='store_true',
+                        help='Add every answered pair to the learned corpus')
+    args = parser.parse_args()
+
+    if args.resume and args.output == '-':
+        parser.error('--resume needs --output FILE')
+    done = resume_output(args.output) if args.resume else set()
+    if done:
+        print(f"Resuming: {len(done)} questions already answered", file=sys.stderr)
+
+    # Started before any thread exists, like the client does
+    client_ai4.PARSE_POOL = ParsePool(args.parse_workers).start()
+    source = sys.stdin if args.questions == '-' else open(args.questions, encoding='utf-8')
+    out = sys.stdout if args.output == '-' else open(args.output, 'a' if args.resume else 'w',
+                                                     encoding='utf-8')
+    try:
+        run_batch(read_questions(source, done), out, workers=args.workers,
+                  fetch_workers=args.fetch_workers, order=args.order, timeout=args.timeout,
+                  save=args.save)
+    except KeyboardInterrupt:
+        print("Interrupted; rerun with --resume to continue.", file=sys.stderr)
+    finally:
+        out.flush()
+        client_ai4.PARSE_POOL.shutdown()
@@ -0,0 +1,156 @@
+import os
+import re
+import sys
+import glob
+import time
+import random
+import argparse
+import tempfile
+
+from bs4 import BeautifulSoup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+sys.path.insert(0, ROOT)
+
+# Importing the scripts opens their caches in the current directory
+os.chdir(tempfile.mkdtemp(prefix='alexandrian-bench-'))
+import server_ai5
+from html_stream import iter_paragraphs, iter_bytes
+from text_pipeline import (clean_response, process_sentences, extract_sentences, extract_wikipedia,
+                           article_paragraphs)
+
+# The early exit only applies when the extraction is all a fetch needs. By
+# default the fetchers hand the whole article to the sentence store, and the
+# parse pool reads the full body before parsing, so they take the 'full'
+# path below; the 'stream' column is the --no-sentence-store, inline case.
+
+WORDS = ["volcano", "island", "magma", "ocean", "plate", "eruption", "lava", "crust"]
+FILLER = ["the", "of", "and", "in", "to", "was", "is", "for", "on", "as", "with", "by", "a"]
+
+
+def synthetic_article(word, paragraphs=400, density=0.02, rng=random):
+    # Shaped like a long real article: the lead names the subject, after
+    # that only about 'density' of the sentences do. The rest is drawn from
+    # a few hundred made-up words, so the keyword doesn't match by chance.
+    vocabulary = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(3, 10)))
+                  for _ in range(400)]
+    body = ['<table class="infobox">' + ''.join(
+        f'<tr><th>{rng.choice(vocabulary)}</th><td>{rng.randint(1, 9999)}</td></tr>' for _ in range(20))
+        + '</table>']
+    for i in range(paragraphs):
+        sentences = []
+        for n in range(rng.randint(3, 8)):
+            words = rng.choices(vocabulary + FILLER * 10, k=rng.randint(8, 24))
+            if (i == 0 and n == 0) or rng.random() < density:
+                words.insert(rng.randrange(len(words)), word)
+            sentences.append(' '.join(words).capitalize() + '.')
+        ref = f'<sup class="reference"><a href="#cite_note-{i}">[{i}]</a></sup>'
+        body.append(f'<p>{" ".join(sentences)}{ref}</p>\n')
+        if i % 25 == 24:
+            body.append(f'<h2><span class="mw-headline">{rng.choice(vocabulary)}</span></h2>\n')
+    body.append('<div class="navbox"><ul>' + ''.join(
+        f'<li><a href="#">{rng.choice(vocabulary)}</a></li>' for _ in range(300)) + '</ul></div>')
+    body.append('<ol class="references">' + ''.join(
+        f'<li id="cite_note-{i}">{" ".join(rng.choices(vocabulary, k=12))}.</li>'
+        for i in range(paragraphs)) + '</ol>')
+    return f'<html><head><title>{word}</title></head><body>{"".join(body)}</body></html>'.encode('utf-8')
+
+
+def save_fixture(word):
+    response = server_ai5.http_client.get(f"https://en.wikipedia.org/wiki/{word.capitalize()}")
+    response.raise_for_status()
+    path = os.path.join(FIXTURES, f"{word.lower()}.html")
+    with open(path, 'wb') as f:
+        f.write(response.content)
+    print(f"Saved {path} ({len(response.content)} bytes)")
+
+
+# ------------------- Current (BeautifulSoup) paths -------------------
+def soup_server(content, word):
+    soup = BeautifulSoup(content, 'html.parser')
+    sentences = []
+    for paragraph in soup.find_all('p'):
+        sentences.extend(re.split(r'(?<=[.!?]) +', paragraph.text))
+    filtered = [clean_response(s) for s in sentences if word.lower() in s.lower()]
+    filtered = [s for s in filtered if s.endswith('.') and not s.endswith(':')]
+    return filtered[:5]
+
+
+def soup_client(content, word):
+    soup = BeautifulSoup(content.decode('utf-8'), 'html.parser')
+    return process_sentences([p.get_text() for p in soup.find_all('p')], word)
+
+
+# ------------------- Streaming paths -------------------
+def stream_server(content, word):
+    return extract_sentences(iter_paragraphs(iter_bytes(content)), word)
+
+
+def stream_client(content, word):
+    return extract_wikipedia(iter_paragraphs(iter_bytes(content)), word)
+
+
+# Whole body first, as the default path does for the sentence store
+def full_server(content, word):
+    return extract_sentences(article_paragraphs(iter_paragraphs(iter_bytes(content))), word)
+
+
+def full_client(content, word):
+    return extract_wikipedia(article_paragraphs(iter_paragraphs(iter_bytes(content))), word)
+
+
+def best_of(func, content, word, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(content, word)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare BeautifulSoup and streaming sentence extraction.')
+    parser.add_argument('--save', nargs='+', metavar='WORD', help='Download articles into benchmarks/fixtures')
+    parser.add_argument('--synthetic', type=int, default=0, metavar='N',
+                        help='Also run on N generated articles (for offline runs)')
+    parser.add_argument('--density', type=float, default=0.02,
+                        help='Share of generated sentences naming the keyword (default: 0.02)')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.save:
+        os.makedirs(FIXTURES, exist_ok=True)
+        for word in args.save:
+            save_fixture(word)
+        return
+
+    articles = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES, '*.html'))):
+        with open(path, 'rb') as f:
+            articles.append((os.path.splitext(os.path.basename(path))[0], f.read()))
+    rng = random.Random(0)
+    for i in range(args.synthetic):
+        word = WORDS[i % len(WORDS)]
+        articles.append((word, synthetic_article(word, density=args.density, rng=rng)))
+    if not articles:
+        print("No fixtures found. Save some with --save WORD or use --synthetic N.")
+        return
+
+    print(f"{'article':<14}{'KiB':>8}{'path':>8}{'soup ms':>10}{'full ms':>9}{'speedup':>9}"
+          f"{'stream ms':>11}{'speedup':>9}  same")
+    for word, content in articles:
+        for name, soup_path, full_path, stream_path in (
+                ("server", soup_server, full_server, stream_server),
+                ("client", soup_client, full_client, stream_client)):
+            soup_time, expected = best_of(soup_path, content, word, args.repeat)
+            full_time, full_result = best_of(full_path, content, word, args.repeat)
+            stream_time, result = best_of(stream_path, content, word, args.repeat)
+            print(f"{word:<14}{len(content) // 1024:>8}{name:>8}{soup_time * 1000:>10.2f}"
+                  f"{full_time * 1000:>9.2f}{soup_time / full_time:>8.1f}x"
+                  f"{stream_time * 1000:>11.2f}{soup_time / stream_time:>8.1f}x  "
+                  f"{result == expected and full_result == expected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import os
+import sys
+import random
+import argparse
+import itertools
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import answer_cache
+import corpus_mmap
+import inverted_index
+import response_history
+import sentence_store
+
+# Measures the per-entry constants the memory governor's size estimates
+# use: each structure is filled with N entries under tracemalloc, and what
+# the traced heap grew by, less the text the estimate already counts, is
+# divided by N. Rerun after changing one of these structures.
+
+FILLER = ["the", "of", "and", "in", "to", "was", "is", "for", "on", "as", "with", "by", "a"]
+ZIPF = {}  # vocabulary size -> cumulative weights
+
+
+def make_vocabulary(rng, size=50000):
+    return [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(4, 10)))
+            for _ in range(size)]
+
+
+def make_sentence(rng, vocabulary, low=8, high=24):
+    # Zipf-like, as in real text: a few words everywhere, most of them rare
+    weights = ZIPF.get(len(vocabulary))
+    if weights is None:
+        weights = ZIPF[len(vocabulary)] = list(itertools.accumulate(
+            1 / rank for rank in range(1, len(vocabulary) + 1)))
+    words = rng.choices(vocabulary, cum_weights=weights, k=rng.randint(low, high))
+    for _ in range(len(words) // 3):
+        words.insert(rng.randrange(len(words)), rng.choice(FILLER))
+    return ' '.join(words).capitalize() + '.'
+
+
+def string_bytes(strings):
+    # What str objects made before tracing cost once a structure owns them
+    return sum(sys.getsizeof(text) for text in strings)
+
+
+def traced(fill):
+    # Heap growth while 'fill' runs; what it returns is kept alive until then
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = fill()
+    grown = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return grown, kept
+
+
+def measure_sentence_store(rng, vocabulary, count):
+    paragraphs = [' '.join(make_sentence(rng, vocabulary) for _ in range(5)) for _ in range(count // 5)]
+    # Normalized keywords are cached once per process, not per sentence
+    for paragraph in paragraphs:
+        sentence_store.sentence_terms(paragraph)
+
+    def fill():
+        store = sentence_store.SentenceStore()
+        store.add(paragraphs)
+        return store
+    grown, store = traced(fill)
+    return (grown - store.text_bytes) / len(store.sentences)
+
+
+def measure_history(rng, vocabulary, count):
+    responses = [' '.join(make_sentence(rng, vocabulary) for _ in range(rng.randint(1, 4)))
+                 for _ in range(count)]
+    # Token hashes are cached once per process, not per entry
+    warm = response_history.ResponseHistory(count)
+    for text in responses:
+        warm.add(text)
+    del warm
+
+    def fill():
+        history = response_history.ResponseHistory(count)
+        for text in responses:
+            history.add(text)
+        return history
+    grown, history = traced(fill)
+    return (grown + string_bytes(responses) - history.text_bytes) / len(history)
+
+
+def measure_answer_cache(rng, vocabulary, count):
+    # The strings exist already; the cache only holds references to them
+    questions = [f"what is {rng.choice(vocabulary)} {n}" for n in range(count)]
+    answers = [make_sentence(rng, vocabulary) for _ in range(count)]
+    cache = answer_cache.AnswerCache(max_entries=count)
+    keys = [answer_cache.canonical_key(q) for q in questions]
+
+    def fill():
+        for key, answer in zip(keys, answers):
+            cache._store(key, answer, 0.1)
+    grown, _ = traced(fill)
+    counted = sum(len(key) + len(answer) for key, answer in zip(keys, answers))
+    return (grown + string_bytes(keys) + string_bytes(answers) - counted) / count
+
+
+def measure_corpus(rng, vocabulary, count):
+    def fill():
+        corpus = corpus_mmap.CorpusDict()
+        for n in range(count):
+            # Built here, so the strings are part of what the corpus holds
+            text = make_sentence(rng, vocabulary)
+            corpus[f"{text[:-1]} {n}"] = {"meaning": text}
+        return corpus
+    grown, corpus = traced(fill)
+    counted = sum(len(key) + len(value["meaning"]) for key, value in corpus.items())
+    return (grown - counted) / count
+
+
+def measure_inverted_index(rng, vocabulary, count):
+    # Two key lengths give two equations: grown / keys = KEY + POSTING * tokens
+    results = []
+    for low, high in ((3, 5), (15, 17)):
+        keys = [make_sentence(rng, vocabulary, low, high)[:-1] for _ in range(count)]
+
+        def fill():
+            index = inverted_index.InvertedIndex()
+            for key in keys:
+                index.add(key)
+            return index
+        grown, index = traced(fill)
+        results.append((grown / len(index.keys), index.total_length / len(index.keys)))
+    (per_key_a, tokens_a), (per_key_b, tokens_b) = results
+    posting = (per_key_b - per_key_a) / (tokens_b - tokens_a)
+    return per_key_a - posting * tokens_a, posting
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the per-entry memory overhead constants.')
+    parser.add_argument('--count', type=int, default=20000, help='Entries per structure')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(rng)
+    key, posting = measure_inverted_index(rng, vocabulary, args.count)
+    rows = [
+        ("sentence_store.SENTENCE_OVERHEAD", sentence_store.SENTENCE_OVERHEAD,
+         measure_sentence_store(rng, vocabulary, args.count)),
+        ("response_history.ENTRY_OVERHEAD", response_history.ENTRY_OVERHEAD,
+         measure_history(rng, vocabulary, args.count)),
+        ("answer_cache.ENTRY_OVERHEAD", answer_cache.ENTRY_OVERHEAD,
+         measure_answer_cache(rng, vocabulary, args.count)),
+        ("corpus_mmap.ENTRY_OVERHEAD", corpus_mmap.ENTRY_OVERHEAD,
+         measure_corpus(rng, vocabulary, args.count)),
+        ("inverted_index.KEY_OVERHEAD", inverted_index.KEY_OVERHEAD, key),
+        ("inverted_index.POSTING_OVERHEAD", inverted_index.POSTING_OVERHEAD, posting),
+    ]
+    print(f"{'constant':<34}{'set':>8}{'measured':>10}")
+    for name, current, measured in rows:
+        print(f"{name:<34}{current:>8}{measured:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
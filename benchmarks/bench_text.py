@@ -0,0 +1,111 @@
+import os
+import re
+import sys
+import random
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import text_pipeline
+
+WORDS = ["volcano", "island", "magma", "ocean", "plate", "eruption", "lava", "crust",
+         "the", "of", "and", "is", "formed", "when", "rises", "through"]
+
+
+# ------------------- Previous implementations -------------------
+def old_clean_response(response):
+    return re.sub(r'\s*[\d+]', '', response).strip()
+
+
+def old_is_meaningless(sentence, keyword):
+    if re.match(rf'^{keyword}[,\s]*(?:{keyword}[,\s]*)+or {keyword}$', sentence, re.I):
+        return True
+    return len(sentence.split()) < 5 or sentence.count(' ') < 3
+
+
+def old_process_sentences(sentences, keyword):
+    filtered = []
+    for s in sentences:
+        s = re.sub(r'\s*\[\d+\]', '', s.strip())
+        s = re.sub(r'\s+', ' ', s)
+        if (s and s[0].isupper() and s.endswith('.')
+            and not old_is_meaningless(s, keyword)
+            and keyword.lower() in s.lower()):
+            filtered.append(s)
+    return filtered[:10]
+
+
+def old_score_sentence(sentence, keyword):
+    keyword = keyword.lower()
+    words = sentence.lower().split()
+    try:
+        pos = words.index(keyword)
+    except ValueError:
+        return 0
+
+    position_score = 1.5 - (pos / len(words))
+    starts_with = 3 if words[0] == keyword else 0
+    length_score = min(len(words)/30, 1)
+    return position_score + starts_with + length_score
+
+
+def old_score_all(sentences, keywords):
+    scored = []
+    for s in sentences:
+        for kw in keywords:
+            if kw.lower() in s.lower():
+                scored.append((old_score_sentence(s, kw), s))
+    return scored
+
+
+# ------------------- Fixtures -------------------
+def make_sentences(count, seed=0):
+    rng = random.Random(seed)
+    sentences = []
+    for i in range(count):
+        words = rng.choices(WORDS, k=rng.randint(3, 30))
+        sentence = ' '.join(words).capitalize() + '.'
+        if rng.random() < 0.3:
+            sentence = f"  {sentence}[{i % 40}]  "
+        sentences.append(sentence)
+    return sentences
+
+
+def run(name, old, new, number):
+    assert old() == new(), f"{name}: results differ"
+    old_time = min(timeit.repeat(old, number=number, repeat=5)) / number
+    new_time = min(timeit.repeat(new, number=number, repeat=5)) / number
+    print(f"{name:<22}{old_time * 1e6:>12.1f}{new_time * 1e6:>12.1f}{old_time / new_time:>9.2f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the text-processing hot path.')
+    parser.add_argument('--sentences', type=int, default=200, help='Candidate sentences per turn')
+    parser.add_argument('--number', type=int, default=50)
+    args = parser.parse_args()
+
+    sentences = make_sentences(args.sentences)
+    keywords = ["volcano", "island", "magma"]
+
+    print(f"{'benchmark':<22}{'old us':>12}{'new us':>12}{'speedup':>10}")
+    run("clean_response",
+        lambda: [old_clean_response(s) for s in sentences],
+        lambda: [text_pipeline.clean_response(s) for s in sentences], args.number)
+    run("process_sentences",
+        lambda: [old_process_sentences(sentences, kw) for kw in keywords],
+        lambda: [text_pipeline.process_sentences(sentences, kw) for kw in keywords], args.number)
+    run("is_meaningless",
+        lambda: [old_is_meaningless(s, kw) for s in sentences for kw in keywords],
+        lambda: [text_pipeline.is_meaningless(s, kw) for s in sentences for kw in keywords], args.number)
+    run("score (per keyword)",
+        lambda: old_score_all(sentences, keywords),
+        lambda: text_pipeline.score_sentences(sentences, keywords), args.number)
+
+    scored = text_pipeline.score_sentences(sentences, keywords)
+    old_order = [s for _, s in sorted(old_score_all(sentences, keywords), reverse=True, key=lambda x: x[0])]
+    assert list(dict.fromkeys(old_order)) == text_pipeline.rank_sentences(scored)
+    print("rankings match score_sentence")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+sys.path.insert(0, ROOT)
+
+from framing import FrameReader, send_message
+from instrumentation import Histogram
+from corpus_log import CorpusLog
+
+SERVER_PORT = 5000
+WORDS = ["volcano", "island", "magma", "ocean", "plate", "eruption", "lava", "crust",
+         "river", "delta", "glacier", "desert", "forest", "mountain", "canyon", "reef"]
+FILLER = ["the", "is", "a", "of", "and", "near", "with", "about", "what", "tell", "me"]
+
+
+# ------------------- Stub HTTP sources -------------------
+def synthetic_article(word, paragraphs=60):
+    rng = random.Random(word)
+    body = []
+    for i in range(paragraphs):
+        sentences = []
+        for _ in range(rng.randint(3, 8)):
+            words = rng.choices(WORDS + FILLER, k=rng.randint(6, 20))
+            if rng.random() < 0.3:
+                words.insert(rng.randrange(len(words)), word.lower())
+            sentences.append(' '.join(words).capitalize() + '.')
+        ref = f'<sup class="reference"><a href="#cite_note-{i}">[{i}]</a></sup>'
+        body.append(f'<p>{" ".join(sentences)}{ref}</p>\n<div class="infobox"><span>{i}</span></div>')
+    return f'<html><head><title>{word}</title></head><body>{"".join(body)}</body></html>'.encode('utf-8')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Answers like en.wikipedia.org, api.duckduckgo.com and www.wikidata.org:
+    # recorded fixtures where benchmarks/fixtures has them, synthetic otherwise.
+    protocol_version = 'HTTP/1.1'
+    latency = 0.0
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.latency:
+            time.sleep(self.latency)
+        parts = urlsplit(self.path)
+        query = parse_qs(parts.query)
+
+        if parts.path.startswith('/wiki/'):
+            word = parts.path[len('/wiki/'):].lower()
+            if word not in WORDS and not os.path.exists(os.path.join(FIXTURES, f"{word}.html")):
+                self._send(404, b'<html><body><p>Not found.</p></body></html>', 'text/html; charset=UTF-8')
+                return
+            path = os.path.join(FIXTURES, f"{word}.html")
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    body = f.read()
+            else:
+                body = synthetic_article(word)
+            self._send(200, body, 'text/html; charset=UTF-8')
+        elif parts.path == '/w/api.php':
+            search = query.get('search', [''])[0]
+            results = [{"description": f"{term} is a word used in this benchmark."}
+                       for term in search.split() if term in WORDS]
+            self._send(200, json.dumps({"search": results[:3]}).encode('utf-8'), 'application/json')
+        else:
+            terms = query.get('q', [''])[0].split()
+            # Every other query has an abstract, so both enhanced branches run
+            abstract = ''
+            if sum(map(len, terms)) % 2:
+                abstract = f"{' '.join(terms).capitalize()} is described in the stub abstract."
+            self._send(200, json.dumps({"AbstractText": abstract}).encode('utf-8'), 'application/json')
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Pooled keep-alive connections are reset when the server under test exits
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def start_stub(latency):
+    StubHandler.latency = latency
+    stub = StubServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=stub.serve_forever, daemon=True).start()
+    return stub
+
+
+# ------------------- Workload -------------------
+def synthetic_conversation(rng, turns):
+    messages = []
+    for _ in range(turns):
+        words = rng.choices(FILLER, k=rng.randint(1, 4)) + rng.sample(WORDS, rng.randint(1, 3))
+        rng.shuffle(words)
+        messages.append(' '.join(words))
+    return messages
+
+
+def load_conversations(path):
+    # One message per line, blank lines separate conversations
+    conversations = [[]]
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                conversations[-1].append(line)
+            elif conversations[-1]:
+                conversations.append([])
+    return [c for c in conversations if c]
+
+
+def seed_corpus(directory, entries, rng):
+    inputs, responses = {}, {}
+    for _ in range(entries):
+        key = ' '.join(rng.choices(WORDS + FILLER, k=rng.randint(3, 12)))
+        value = ' '.join(rng.choices(WORDS + FILLER, k=rng.randint(8, 30))).capitalize() + '.'
+        inputs[key] = {"meaning": value}
+        responses[value] = {"meaning": value}
+    CorpusLog(directory).write_snapshot(inputs, responses)
+
+
+# ------------------- Measurements -------------------
+def rss_bytes(pid):
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def tree_rss_bytes(pid):
+    # Prefork workers are children of the supervisor. Shared pages count once
+    # per process here, so this overstates what the workers really cost.
+    pids, total = [pid], 0
+    while pids:
+        pid = pids.pop()
+        rss = rss_bytes(pid)
+        total += rss or 0
+        try:
+            with open(f'/proc/{pid}/task/{pid}/children') as f:
+                pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return total or None
+
+
+def corpus_bytes(directory):
+    total = 0
+    for name in ('corpus.log', 'corpus.log.1', 'corpus.snapshot.json', 'corpus.bin'):
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            total += os.path.getsize(path)
+    return total
+
+
+def summarize(histogram):
+    # Histogram records microseconds
+    return {
+        "count": histogram.count,
+        "mean_ms": histogram.total / histogram.count / 1000 if histogram.count else 0,
+        "p50_ms": histogram.percentile(50) / 1000,
+        "p95_ms": histogram.percentile(95) / 1000,
+        "p99_ms": histogram.percentile(99) / 1000,
+        "max_ms": histogram.max / 1000,
+    }
+
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            socket.create_connection(('localhost', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not listen on port {port} within {timeout}s")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ------------------- Clients -------------------
+def run_client(messages, histogram, first_histogram, lock, errors, think_time):
+    try:
+        with socket.create_connection(('localhost', SERVER_PORT), timeout=60) as sock:
+            reader = FrameReader(sock)
+            reader.read_message()  # the server opens with a random starter
+            for message in messages:
+                start = time.perf_counter_ns()
+                send_message(sock, message)
+                # Without --stream the first part is the whole reply
+                first = None
+                for _ in reader.read_parts():
+                    if first is None:
+                        first = time.perf_counter_ns() - start
+                if first is None:
+                    raise ConnectionError("server closed the connection")
+                elapsed = time.perf_counter_ns() - start
+                with lock:
+                    histogram.record(elapsed // 1000)
+                    first_histogram.record(first // 1000)
+                if think_time:
+                    time.sleep(think_time)
+    except Exception as e:
+        with lock:
+            errors.append(f"{type(e).__name__}: {e}")
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix='alexandrian-load-')
+    stub = start_stub(args.stub_latency / 1000)
+    stub_url = f"http://127.0.0.1:{stub.server_address[1]}"
+    metrics_port = free_port()
+
+    if args.seed_entries:
+        seed_corpus(workdir, args.seed_entries, rng)
+
+    if args.conversations:
+        conversations = load_conversations(args.conversations)
+    else:
+        conversations = [synthetic_conversation(rng, args.turns) for _ in range(args.clients)]
+
+    env = dict(os.environ)
+    env['ALEXANDRIAN_HOST_OVERRIDES'] = ','.join(
+        f"{host}={stub_url}" for host in ('en.wikipedia.org', 'api.duckduckgo.com', 'www.wikidata.org'))
+    env['ALEXANDRIAN_HTTP_RATE'] = str(args.http_rate)
+    env['PYTHONPATH'] = ROOT
+    command = [sys.executable, os.path.join(ROOT, 'server_ai5.py'), '-a',
+               '--metrics-port', str(metrics_port), '--scoring', args.scoring]
+    if args.prefetch:
+        command.append('--prefetch')
+    if args.prefork:
+        command += ['--prefork', str(args.prefork)]  # stages then come from worker 0 only
+    if args.stream:
+        command.append('--stream')
+    if args.memory_budget:
+        command += ['--memory-budget', args.memory_budget]
+
+    log = open(os.path.join(workdir, 'server.log'), 'wb')
+    server = subprocess.Popen(command, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT,
+                              stdin=subprocess.DEVNULL)
+    samples = []
+    try:
+        wait_for_port(SERVER_PORT, server)
+        histogram = Histogram()
+        first_histogram = Histogram()
+        lock = threading.Lock()
+        errors = []
+        threads = [threading.Thread(target=run_client,
+                                    args=(conversations[i % len(conversations)], histogram,
+                                          first_histogram, lock,
+                                          errors, args.think_time / 1000))
+                   for i in range(args.clients)]
+
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        while any(thread.is_alive() for thread in threads):
+            with lock:
+                messages = histogram.count
+            samples.append({"t_s": round(time.monotonic() - started, 3), "messages": messages,
+                            "rss_bytes": tree_rss_bytes(server.pid), "corpus_bytes": corpus_bytes(workdir)})
+            time.sleep(args.sample_interval)
+        elapsed = time.monotonic() - started
+        samples.append({"t_s": round(elapsed, 3), "messages": histogram.count,
+                        "rss_bytes": tree_rss_bytes(server.pid), "corpus_bytes": corpus_bytes(workdir)})
+
+        try:
+            with urllib.request.urlopen(f"http://localhost:{metrics_port}/metrics", timeout=5) as r:
+                server_stages = json.load(r)["stages"]
+        except OSError:
+            server_stages = None
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        log.close()
+        stub.shutdown()
+
+    result = {
+        "revision": git_revision(),
+        "config": {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+        "elapsed_s": elapsed,
+        "messages": histogram.count,
+        "messages_per_s": histogram.count / elapsed if elapsed else 0,
+        "errors": errors,
+        "latency": summarize(histogram),
+        "first_part_latency": summarize(first_histogram),
+        "samples": samples,
+        "server_stages": server_stages,
+    }
+    if args.keep:
+        result["workdir"] = workdir
+    else:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return result
+
+
+def compare(old, new):
+    print(f"{'':<44}{'old':>12}{'new':>12}{'change':>10}")
+    rows = [("msgs/s", old["messages_per_s"], new["messages_per_s"])]
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        rows.append((key, old["latency"][key], new["latency"][key]))
+    if "first_part_latency" in old and "first_part_latency" in new:
+        rows.append(("first part p95_ms", old["first_part_latency"]["p95_ms"],
+                     new["first_part_latency"]["p95_ms"]))
+    for stage in sorted(set(old.get("server_stages") or {}) & set(new.get("server_stages") or {})):
+        rows.append((stage + " p95", old["server_stages"][stage]["p95_ms"],
+                     new["server_stages"][stage]["p95_ms"]))
+    for name, before, after in rows:
+        change = f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+        print(f"{name:<44}{before:>12.2f}{after:>12.2f}{change:>10}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Replay conversations against an offline server_ai5.py -a and report throughput.')
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent simulated clients')
+    parser.add_argument('--turns', type=int, default=25, help='Messages per synthetic conversation')
+    parser.add_argument('--conversations', metavar='FILE',
+                        help='Replay recorded conversations: one message per line, blank line between them')
+    parser.add_argument('--seed-entries', type=int, default=0,
+                        help='Start from a synthetic corpus of this many entries')
+    parser.add_argument('--stub-latency', type=float, default=20, help='Stub source latency in ms')
+    parser.add_argument('--think-time', type=float, default=0, help='Pause between messages in ms')
+    parser.add_argument('--http-rate', type=float, default=1000,
+                        help='Per-host request rate for the pooled client (default: 1000/s)')
+    parser.add_argument('--scoring', default='count')
+    parser.add_argument('--prefetch', action='store_true')
+    parser.add_argument('--prefork', type=int, metavar='N', help='Run the server with N worker processes')
+    parser.add_argument('--memory-budget', metavar='SIZE',
+                        help="Server RSS budget, e.g. 200M; watch rss_bytes in the samples")
+    parser.add_argument('--stream', action='store_true',
+                        help='Have the server stream replies; see first_part_latency')
+    parser.add_argument('--sample-interval', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--keep', action='store_true', help='Keep the working directory and server log')
+    parser.add_argument('--output', metavar='PATH', help='Write the JSON result here instead of stdout')
+    parser.add_argument('--compare', metavar='PATH', help='Print the change against an earlier result')
+    args = parser.parse_args()
+
+    result = run(args)
+    text = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+    print(f"{result['messages']} messages in {result['elapsed_s']:.1f}s "
+          f"({result['messages_per_s']:.1f}/s), p50 {result['latency']['p50_ms']:.1f}ms, "
+          f"p99 {result['latency']['p99_ms']:.1f}ms, first part p50 "
+          f"{result['first_part_latency']['p50_ms']:.1f}ms, {len(result['errors'])} errors", file=sys.stderr)
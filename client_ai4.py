@@ -1,21 +1,45 @@
 import socket
 import json
 import random
-import requests
 import os
 import re
+import argparse
 from collections import deque
 from concurrent.futures import ThreadPoolExecutor
-from bs4 import BeautifulSoup
 import colorama
 from colorama import Fore, Style
+from corpus_log import CorpusLog
+from corpus_mmap import CorpusDict, memory_bytes, release_pages
+from fetch_cache import FetchCache, MISS
+from http_pool import HttpClient
+from parse_pool import ParsePool
+from framing import FrameReader, join_chunks, send_message
+from text_pipeline import (article_paragraphs, extract_wikipedia, score_sentences, rank_sentences,
+                           STOPWORDS, QUESTION_WORDS)
+from prefetch import PrefetchWorker
+from source_race import SourceRacer
+from sentence_store import SentenceStore, DEFAULT_MAX_SENTENCES
+from answer_cache import AnswerCache, DEFAULT_ENTRIES, DEFAULT_TTL
+from wiki_dump import WikiIndex
+from response_history import ResponseHistory, DEFAULT_THRESHOLD, parse_threshold
+from instrumentation import METRICS, add_metrics_arguments, configure_metrics
+from memory_governor import GOVERNOR, add_memory_arguments, configure_memory
 
 # Global configurations
-CACHE = {}
-LAST_RESPONSES = deque(maxlen=3)
+CACHE = FetchCache()  # shared on disk with server_ai5.py
+HTTP = HttpClient.from_env()
+WIKI_INDEX = WikiIndex.open_existing()  # built by wiki_dump.py for offline lookups
+PARSE_POOL = ParsePool(0)  # parses in the fetching thread until main starts the workers
+FETCH_EXECUTOR = ThreadPoolExecutor(max_workers=10)  # shared by every turn
+RACER = SourceRacer(FETCH_EXECUTOR, budget=3.0)
+GOOD_ENOUGH_SCORE = 4.0  # keyword opens the sentence; stop waiting for other sources
+STORE = SentenceStore()  # every fetched sentence, for multi-keyword answers
+LAST_RESPONSES = ResponseHistory(window=3)
 HISTORY = deque(maxlen=5)
-STOPWORDS = {"it", "to", "so", "a", "the", "about", "is", "of", "in", "on"}
-QUESTION_WORDS = {"what", "where", "when", "why", "how", "who", "which", "tell", "explain", "describe"}
+PREFETCH = None  # PrefetchWorker when started with --prefetch
+FALLBACK_RESPONSE = "Could you please rephrase or provide more context?"
+ANSWERS = AnswerCache(keep=lambda answer: answer != FALLBACK_RESPONSE)  # whole answers by question
+corpus_log = CorpusLog()
 
 # ANSI colors
 WHITE = "\033[97m"
@@ -24,6 +48,9 @@ GREEN = "\033[92m"
 RESET = "\033[0m"
 
 def load_responses():
+    if corpus_log.exists():
+        return corpus_log.load()
+
     try:
         with open('inputs.json', 'r') as f:
             inputs = json.load(f)
@@ -36,46 +63,92 @@ def load_responses():
     except FileNotFoundError:
         responses = {"input": {}}
 
-    return inputs['input'], responses['input']
+    if inputs['input'] or responses['input']:
+        corpus_log.write_snapshot(inputs['input'], responses['input'])
+    return CorpusDict(inputs['input']), CorpusDict(responses['input'])
+
+def register_memory(inputs_dict, responses_dict):
+    # Same order as the server: reread pages, answers, fetched sentences
+    GOVERNOR.register('corpus', lambda: memory_bytes(inputs_dict, responses_dict),
+                      lambda fraction: release_pages(inputs_dict, responses_dict))
+    GOVERNOR.register('fetch_cache', CACHE.memory_bytes, CACHE.shrink)
+    if ANSWERS:
+        GOVERNOR.register('answer_cache', ANSWERS.memory_bytes, ANSWERS.shrink, priority=1)
+    if STORE:
+        GOVERNOR.register('sentence_store', STORE.memory_bytes, STORE.shrink, priority=2)
+    GOVERNOR.register('history', LAST_RESPONSES.memory_bytes, LAST_RESPONSES.shrink, priority=3,
+                      restore=LAST_RESPONSES.restore)
 
+@METRICS.timed('save')
 def save_input_response(inputs_dict, responses_dict, input_message, response_message):
     inputs_dict[input_message] = {"meaning": input_message}
-    with open('inputs.json', 'w') as f:
-        json.dump({"input": inputs_dict}, f, ensure_ascii=False, indent=4)
-
     responses_dict[response_message] = {"meaning": response_message}
-    with open('responses.json', 'w') as f:
-        json.dump({"input": responses_dict}, f, ensure_ascii=False, indent=4)
+    corpus_log.append([input_message, inputs_dict[input_message]],
+                      [response_message, responses_dict[response_message]])
 
 # ------------------- Data Sources -------------------
+@METRICS.timed('fetch', source='wikipedia')
 def fetch_wikipedia(word):
-    if word in CACHE:
-        return CACHE[word]
+    if WIKI_INDEX:
+        paragraphs = WIKI_INDEX.lookup(word)
+        if paragraphs is not None:
+            METRICS.tag(cache='dump')
+            if STORE:
+                STORE.add(paragraphs)
+            return extract_wikipedia(paragraphs, word)
+
+    cached = CACHE.get('wikipedia', word)
+    METRICS.tag(cache='miss' if cached is MISS else 'hit')
+    if cached is not MISS:
+        if STORE:
+            STORE.add(cached)  # after a restart the store starts out empty
+        return cached
     
     url = f"https://en.wikipedia.org/wiki/{word.capitalize()}"
     try:
-        response = requests.get(url, timeout=5)
-        if response.status_code == 200:
-            soup = BeautifulSoup(response.text, 'html.parser')
-            paragraphs = soup.find_all('p')
-            sentences = [p.get_text() for p in paragraphs]
-            processed = process_sentences(sentences, word)
-            CACHE[word] = processed
-            return processed
+        response = HTTP.get(url, timeout=5, stream=True)
+        with response:
+            if response.status_code == 200:
+                if '(disambiguation)' in response.url:
+                    return CACHE.put_negative('wikipedia', word, [])
+                with METRICS.span('extract', source='wikipedia'):
+                    if STORE:
+                        paragraphs = PARSE_POOL.parse(response, article_paragraphs, word)
+                        STORE.add(paragraphs)
+                        processed = extract_wikipedia(paragraphs, word)
+                    else:
+                        processed = PARSE_POOL.parse(response, extract_wikipedia, word)
+                return CACHE.put('wikipedia', word, processed)
+            if response.status_code == 404:
+                return CACHE.put_negative('wikipedia', word, [])
     except:
         pass
     return []
 
+@METRICS.timed('fetch', source='duckduckgo')
 def fetch_duckduckgo(word):
+    cached = CACHE.get('duckduckgo', word)
+    METRICS.tag(cache='miss' if cached is MISS else 'hit')
+    if cached is not MISS:
+        return cached
+
     url = "https://api.duckduckgo.com/"
     params = {"q": word, "format": "json", "no_html": 1}
     try:
-        data = requests.get(url, params=params, timeout=5).json()
-        return [data.get('AbstractText', "")] if data.get('AbstractText') else []
+        data = HTTP.get(url, params=params, timeout=5).json()
+        if data.get('AbstractText'):
+            return CACHE.put('duckduckgo', word, [data.get('AbstractText', "")])
+        return CACHE.put_negative('duckduckgo', word, [])
     except:
         return []
 
+@METRICS.timed('fetch', source='wikidata')
 def fetch_wikidata(word):
+    cached = CACHE.get('wikidata', word)
+    METRICS.tag(cache='miss' if cached is MISS else 'hit')
+    if cached is not MISS:
+        return cached
+
     url = "https://www.wikidata.org/w/api.php"
     params = {
         "action": "wbsearchentities",
@@ -84,41 +157,15 @@ def fetch_wikidata(word):
         "language": "en"
     }
     try:
-        data = requests.get(url, params=params, timeout=5).json()
-        return [item.get('description', "") for item in data.get('search', [])[:3]]
+        data = HTTP.get(url, params=params, timeout=5).json()
+        descriptions = [item.get('description', "") for item in data.get('search', [])[:3]]
+        if descriptions:
+            return CACHE.put('wikidata', word, descriptions)
+        return CACHE.put_negative('wikidata', word, [])
     except:
         return []
 
 # ------------------- Core Logic -------------------
-def is_meaningless(sentence, keyword):
-    if re.match(rf'^{keyword}[,\s]*(?:{keyword}[,\s]*)+or {keyword}$', sentence, re.I):
-        return True
-    return len(sentence.split()) < 5 or sentence.count(' ') < 3
-
-def process_sentences(sentences, keyword):
-    filtered = []
-    for s in sentences:
-        s = re.sub(r'\s*\[\d+\]', '', s.strip())
-        s = re.sub(r'\s+', ' ', s)
-        if (s and s[0].isupper() and s.endswith('.') 
-            and not is_meaningless(s, keyword)
-            and keyword.lower() in s.lower()):
-            filtered.append(s)
-    return filtered[:10]
-
-def score_sentence(sentence, keyword):
-    keyword = keyword.lower()
-    words = sentence.lower().split()
-    try:
-        pos = words.index(keyword)
-    except ValueError:
-        return 0
-    
-    position_score = 1.5 - (pos / len(words))
-    starts_with = 3 if words[0] == keyword else 0
-    length_score = min(len(words)/30, 1)
-    return position_score + starts_with + length_score
-
 def resolve_references(input_text):
     if not HISTORY:
         return ""
@@ -147,60 +194,105 @@ def extract_keywords(input_text):
     
     return keywords[:3]
 
+def predict_keywords(outgoing):
+    # The server answers with sentences about the words we send, so our own
+    # keywords are the best guess for the keywords of its next message.
+    predicted = extract_keywords(outgoing)
+    resolved = resolve_references(outgoing)
+    if resolved:
+        predicted.append(resolved)
+    for message in HISTORY:
+        predicted.extend(extract_keywords(message))
+    return predicted
+
 def generate_response(input_text):
-    HISTORY.append(input_text)
-    keywords = extract_keywords(input_text)
-    
-    # Fetch from all sources
-    combined = []
-    with ThreadPoolExecutor(max_workers=5) as executor:
-        futures = []
+    with METRICS.span('keywords'):
+        keywords = extract_keywords(input_text)
+    if PREFETCH:
         for word in keywords:
-            for source in [fetch_wikipedia, fetch_duckduckgo, fetch_wikidata]:
-                futures.append(executor.submit(source, word))
-        
-        for future in futures:
-            combined.extend(future.result())
-
-    # Score and select sentences
-    scored = []
-    for s in combined:
-        for kw in keywords:
-            if kw.lower() in s.lower():
-                scored.append((score_sentence(s, kw), s))
+            PREFETCH.consume(word)
     
-    scored.sort(reverse=True, key=lambda x: x[0])
-    candidates = list({s for _, s in scored if s.strip()})
+    # Keywords the store already knows are answered from it, together, so
+    # sentences naming several of them score highest; only the rest are fetched
+    local, missing = [], keywords
+    if STORE:
+        with METRICS.span('local'):
+            local = STORE.search(keywords)
+            missing = STORE.missing(keywords)
+    best = [max([score for score, sentence in local if sentence not in LAST_RESPONSES], default=0)]
+
+    # Fetch from all sources, scoring each result as it arrives
+    calls = [(name, source, word) for word in missing
+             for name, source in [('wikipedia', fetch_wikipedia), ('duckduckgo', fetch_duckduckgo),
+                                  ('wikidata', fetch_wikidata)]]
+    scored = {}
+
+    def on_result(number, source, word, sentences):
+        scored[number] = score_sentences(sentences, keywords)
+        for score, sentence in scored[number]:
+            if score > best[0] and sentence not in LAST_RESPONSES:
+                best[0] = score
+
+    with METRICS.span('fetch_all'):
+        RACER.race(calls, on_result, good_enough=lambda: best[0] >= GOOD_ENOUGH_SCORE)
+
+    # Submission order, so equal scores rank the same however the race went
+    with METRICS.span('score'):
+        candidates = rank_sentences(local + [pair for number in sorted(scored) for pair in scored[number]])
     
     # Select non-repeating response
     for candidate in candidates:
-        if candidate not in LAST_RESPONSES:
-            LAST_RESPONSES.append(candidate)
+        if LAST_RESPONSES.add_if_new(candidate):
             return candidate[:500]
     
-    return "Could you please rephrase or provide more context?"
+    return FALLBACK_RESPONSE
+
+def answer_message(input_text):
+    HISTORY.append(input_text)
+    if ANSWERS is None:
+        return generate_response(input_text)
+    # A cached answer is only used if it isn't one of our recent responses
+    return ANSWERS.get_or_compute(input_text, lambda: generate_response(input_text),
+                                  accept=LAST_RESPONSES.add_if_new)
 
 # ------------------- Client Code -------------------
 def start_client():
     inputs_dict, responses_dict = load_responses()
+    register_memory(inputs_dict, responses_dict)
     client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     client.connect(('localhost', 5000))
     print(f"{Fore.GREEN}Connected to server. Start chatting!{RESET}")
 
+    reader = FrameReader(client)
     while True:
         try:
-            message = client.recv(4096).decode('utf-8').strip()
+            # A streamed reply is shown chunk by chunk as it arrives
+            parts = []
+            with METRICS.span('receive'):
+                for part in reader.read_parts():
+                    if part.strip():
+                        shown = any(p.strip() for p in parts)
+                        print(' ' if shown else f"\n{Fore.RED}Server:{RESET} ", end='')
+                        print(part.strip(), end='', flush=True)
+                    parts.append(part)
+            if not parts:
+                print(f"{Fore.RED}Server closed the connection.{RESET}")
+                break
+            message = join_chunks(parts).strip()
             if not message:
                 continue
+            print()
             
-            print(f"\n{Fore.RED}Server:{RESET} {message}")
-            
-            # Generate response using same logic as server
-            response = generate_response(message)
-            print(f"{Fore.GREEN}You:{RESET} {response}")
-            
-            save_input_response(inputs_dict, responses_dict, message, response)
-            client.sendall(response.encode('utf-8'))
+            with METRICS.span('turn'):
+                # Generate response using same logic as server
+                response = answer_message(message)
+                print(f"{Fore.GREEN}You:{RESET} {response}")
+                
+                save_input_response(inputs_dict, responses_dict, message, response)
+                if PREFETCH:
+                    PREFETCH.predict(predict_keywords(response))
+                with METRICS.span('send'):
+                    send_message(client, response)
 
             if message.lower() in ['exit', 'quit']:
                 break
@@ -210,8 +302,53 @@ def start_client():
             break
 
     client.close()
+    print(f"Sources: {RACER.stats()}")
+    if STORE:
+        print(f"Sentence store: {STORE.stats()}")
+    if ANSWERS:
+        print(f"Answer cache: {ANSWERS.stats()}")
+    if PREFETCH:
+        print(f"Prefetch: {PREFETCH.stats()}")
+    print(f"Memory: {GOVERNOR.stats()}")
 
 if __name__ == "__main__":
     os.system('cls' if os.name == 'nt' else 'clear')
     print(f"{Fore.RED}========= AI Conversation Client =========")
+
+    parser = argparse.ArgumentParser(description='Run the conversation client.')
+    parser.add_argument('--prefetch', action='store_true',
+                        help='Warm the fetch cache for the likely next keywords in the background')
+    parser.add_argument('--history-window', type=int, default=3,
+                        help='Own responses remembered for repeat suppression (default: 3)')
+    parser.add_argument('--history-threshold', type=parse_threshold, default=DEFAULT_THRESHOLD,
+                        help='SimHash bits a near-duplicate may differ in; -1 only rejects exact repeats '
+                             f'(default: {DEFAULT_THRESHOLD})')
+    parser.add_argument('--budget', type=float, default=3.0,
+                        help='Seconds a turn waits for slow sources (default: 3)')
+    parser.add_argument('--parse-workers', type=int,
+                        help='Processes parsing fetched articles; 0 parses in the fetch threads '
+                             '(default: one per CPU but one)')
+    parser.add_argument('--sentence-store', type=int, default=DEFAULT_MAX_SENTENCES, metavar='N',
+                        help='Fetched sentences kept for multi-keyword answers; 0 disables '
+                             f'(default: {DEFAULT_MAX_SENTENCES})')
+    parser.add_argument('--answer-cache', type=int, default=DEFAULT_ENTRIES, metavar='N',
+                        help=f'Whole answers remembered by normalized question; 0 disables (default: {DEFAULT_ENTRIES})')
+    parser.add_argument('--answer-ttl', type=float, default=DEFAULT_TTL, metavar='SECONDS',
+                        help=f'How long a remembered answer stays fresh (default: {DEFAULT_TTL})')
+    add_metrics_arguments(parser)
+    add_memory_arguments(parser)
+    args = parser.parse_args()
+
+    PARSE_POOL = ParsePool(args.parse_workers).start()
+    configure_metrics(args)
+    configure_memory(args)
+    LAST_RESPONSES = ResponseHistory(args.history_window, args.history_threshold)
+    RACER.budget = args.budget
+    STORE = SentenceStore(args.sentence_store) if args.sentence_store else None
+    ANSWERS = (AnswerCache(args.answer_cache, args.answer_ttl, keep=lambda answer: answer != FALLBACK_RESPONSE)
+               if args.answer_cache else None)
+    if args.prefetch:
+        PREFETCH = PrefetchWorker(CACHE, [('wikipedia', fetch_wikipedia),
+                                          ('duckduckgo', fetch_duckduckgo),
+                                          ('wikidata', fetch_wikidata)])
     start_client()
@@ -0,0 +1,124 @@
+import os
+import json
+import time
+import socket
+import subprocess
+
+from framing import FrameReader, send_message
+
+try:
+    import fcntl
+except ImportError:  # Windows: server_ai5.py imports this module, the worker needs Unix
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CODEGEN_DIR = os.path.join(BASE_DIR, 'local_codegen_ai')
+MODEL_DIR = os.path.join(CODEGEN_DIR, 'model')
+SOCKET_PATH = os.path.join(CODEGEN_DIR, 'codegen.sock')
+VENV_PYTHON = os.path.join(CODEGEN_DIR, 'venv', 'bin', 'python')
+
+
+class CodegenUnavailable(Exception):
+    pass
+
+
+def lock_path(path=SOCKET_PATH):
+    return path + '.lock'
+
+
+def worker_running(path=SOCKET_PATH):
+    # The worker holds this lock from before loading the model until it exits
+    if fcntl is None:
+        return False
+    try:
+        with open(lock_path(path), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+class CodegenClient:
+    def __init__(self, path=SOCKET_PATH, timeout=300):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.reader = FrameReader(self.sock)
+
+    def generate(self, prompt, max_length=200, temperature=0.7):
+        send_message(self.sock, json.dumps({"prompt": prompt, "max_length": max_length,
+                                            "temperature": temperature}))
+        reply = self.reader.read_message()
+        if reply is None:
+            raise ConnectionError("codegen server closed the connection")
+        reply = json.loads(reply)
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        return reply['code']
+
+    def close(self):
+        self.sock.close()
+
+
+def start_worker(path=SOCKET_PATH, quantize=False, timeout=180):
+    # Starts codegen_server.py once; it outlives this process and every later
+    # console session connects to the already loaded model.
+    if not os.path.exists(VENV_PYTHON) or not os.path.isdir(MODEL_DIR):
+        raise CodegenUnavailable("Local coding AI is not set up; run: bash coding_ai_setup.sh")
+
+    # One may still be loading the model, e.g. the one the setup script started
+    worker = None
+    if not worker_running(path):
+        command = [VENV_PYTHON, os.path.join(BASE_DIR, 'codegen_server.py'), '--socket', path]
+        if quantize:
+            command.append('--quantize')
+        with open(os.path.join(CODEGEN_DIR, 'codegen_server.log'), 'ab') as log:
+            worker = subprocess.Popen(command, cwd=BASE_DIR, stdout=log, stderr=subprocess.STDOUT,
+                                      stdin=subprocess.DEVNULL, start_new_session=True)
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if worker is not None and worker.poll() is not None and not worker_running(path):
+            raise CodegenUnavailable("codegen_server.py exited; see local_codegen_ai/codegen_server.log")
+        try:
+            return CodegenClient(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            time.sleep(0.5)
+    raise CodegenUnavailable(f"codegen_server.py did not come up within {timeout}s")
+
+
+def connect(path=SOCKET_PATH, quantize=False):
+    try:
+        return CodegenClient(path)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print("Loading the coding model (first time only)...")
+        return start_worker(path, quantize)
+
+
+def run_console(path=SOCKET_PATH):
+    try:
+        client = connect(path)
+    except CodegenUnavailable as e:
+        print(e)
+        return
+
+    print("\nLocal Coding AI (type 'quit' to exit)")
+    try:
+        while True:
+            prompt = input("\nPrompt: ")
+            if prompt.lower() in ['quit', 'exit']:
+                break
+            try:
+                print("\n" + client.generate(prompt))
+            except (RuntimeError, OSError) as e:
+                print(f"Generation failed: {e}")
+    except (KeyboardInterrupt, EOFError):
+        pass
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    run_console()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# Keeps codegen-350M loaded and answers prompts over a Unix socket.
+# Run it with the venv made by coding_ai_setup.sh:
+#   local_codegen_ai/venv/bin/python codegen_server.py [--quantize]
+import os
+import sys
+import json
+import fcntl
+import queue
+import socket
+import argparse
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import black
+import torch
+from transformers import AutoTokenizer, AutoModelForCausalLM
+
+from framing import FrameReader, ProtocolError, send_message
+from codegen_client import MODEL_DIR, SOCKET_PATH, lock_path
+
+
+def format_code(code):
+    try:
+        return black.format_str(code, mode=black.FileMode())
+    except Exception:
+        return code
+
+
+class BatchingGenerator:
+    # Prompts that arrive within 'max_wait' of each other share one
+    # generate() call; on CPU a batch of 8 costs far less than 8 single runs.
+    def __init__(self, model_dir=MODEL_DIR, quantize=False, max_batch=8, max_wait=0.05,
+                 format_workers=2):
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.tokenizer.padding_side = 'left'  # generation continues from the right edge
+        self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.model = AutoModelForCausalLM.from_pretrained(model_dir)
+        self.model.eval()
+        if quantize:
+            # int8 weights for every Linear layer: about a quarter of the
+            # memory and faster matmuls on CPU, at a small quality cost
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear},
+                                                             dtype=torch.qint8)
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        # black is pure Python and slow; it must not hold up the next batch
+        self.formatter = ThreadPoolExecutor(max_workers=format_workers)
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, prompt, max_length=200, temperature=0.7):
+        future = Future()
+        self.requests.put((prompt, max_length, temperature, future))
+        return future
+
+    def _collect(self):
+        batch = [self.requests.get()]
+        params = batch[0][1:3]
+        deferred = []
+        try:
+            while len(batch) < self.max_batch:
+                request = self.requests.get(timeout=self.max_wait)
+                # One generate() call samples with one set of parameters
+                (batch if request[1:3] == params else deferred).append(request)
+        except queue.Empty:
+            pass
+        for request in deferred:
+            self.requests.put(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                texts = self._generate([r[0] for r in batch], *batch[0][1:3])
+            except Exception as e:
+                for request in batch:
+                    request[3].set_exception(e)
+                continue
+            for request, text in zip(batch, texts):
+                formatted = self.formatter.submit(format_code, text)
+                formatted.add_done_callback(lambda f, future=request[3]: future.set_result(f.result()))
+
+    def _generate(self, prompts, max_length, temperature):
+        inputs = self.tokenizer(prompts, return_tensors='pt', padding=True)
+        padded_length = inputs['input_ids'].shape[1]
+        # Each prompt gets the new tokens it would get alone; the batch runs
+        # for the largest budget and the others are cut back afterwards
+        budgets = [max(1, max_length - int(length)) for length in inputs['attention_mask'].sum(dim=1)]
+        with torch.inference_mode():
+            output = self.model.generate(
+                **inputs,
+                max_new_tokens=max(budgets),
+                temperature=temperature,
+                do_sample=True,
+                pad_token_id=self.tokenizer.eos_token_id
+            )
+        return [self.tokenizer.decode(row[:padded_length + budget], skip_special_tokens=True)
+                for row, budget in zip(output, budgets)]
+
+
+def serve_client(conn, generator):
+    reader = FrameReader(conn)
+    try:
+        for message in reader:
+            try:
+                request = json.loads(message)
+                code = generator.submit(request['prompt'], int(request.get('max_length', 200)),
+                                        float(request.get('temperature', 0.7))).result()
+                reply = {"code": code}
+            except (ValueError, KeyError) as e:
+                reply = {"error": f"Bad request: {e}"}
+            except Exception as e:
+                reply = {"error": str(e)}
+            send_message(conn, json.dumps(reply))
+    except (ConnectionError, ProtocolError):
+        pass
+    finally:
+        conn.close()
+
+
+def claim(path):
+    # One worker per socket: held for the worker's life, taken before the
+    # model loads, so a second one started meanwhile gives up at once
+    lock = open(lock_path(path), 'a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        return None
+    return lock
+
+
+def serve(path, generator):
+    # Only the lock holder gets here, so a socket file is a dead worker's
+    if os.path.exists(path):
+        os.remove(path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen(16)
+    print(f"codegen_server.py: Model loaded, listening on {path}", flush=True)
+    try:
+        while True:
+            conn, _ = server.accept()
+            threading.Thread(target=serve_client, args=(conn, generator), daemon=True).start()
+    finally:
+        server.close()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Serve the local codegen model over a Unix socket.')
+    parser.add_argument('--socket', default=SOCKET_PATH)
+    parser.add_argument('--model', default=MODEL_DIR)
+    parser.add_argument('--quantize', action='store_true',
+                        help='int8 dynamic quantization of the Linear layers')
+    parser.add_argument('--max-batch', type=int, default=8)
+    parser.add_argument('--max-wait', type=float, default=50,
+                        help='Milliseconds to wait for more prompts to batch (default: 50)')
+    parser.add_argument('--threads', type=int, help='torch intra-op threads')
+    args = parser.parse_args()
+
+    lock = claim(args.socket)
+    if lock is None:
+        print(f"codegen_server.py: Another worker already serves {args.socket}", flush=True)
+        sys.exit(0)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    generator = BatchingGenerator(args.model, quantize=args.quantize, max_batch=args.max_batch,
+                                  max_wait=args.max_wait / 1000)
+    try:
+        serve(args.socket, generator)
+    except KeyboardInterrupt:
+        pass
@@ -84,8 +84,14 @@ chmod +x local_codegen_ai.py
 # Deactivate virtual environment
 deactivate
 
+# Start the warm model server, so no session pays for loading the model
+# (codegen_server.py lives next to server_ai5.py; --quantize makes it smaller and faster)
+nohup venv/bin/python ../codegen_server.py > codegen_server.log 2>&1 &
+
 # Instructions
-echo -e "\n\nSetup complete! Run your local coding AI with:"
+echo -e "\n\nSetup complete! The model server is loading in the background;"
+echo -e "server_ai5.py's 'run programming console' connects to it."
+echo -e "Run your local coding AI with:"
 echo -e "cd local_codegen_ai && source venv/bin/activate && ./local_codegen_ai.py"
 echo -e "Or for one-time execution:"
 echo -e "cd local_codegen_ai && ./venv/bin/python local_codegen_ai.py"
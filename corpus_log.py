@@ -0,0 +1,342 @@
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import subprocess
+import time
+import zlib
+import argparse
+from contextlib import contextmanager
+from corpus_mmap import BINARY_FILE, CorpusDict, write_corpus, load_corpus
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to in-process locking only
+    fcntl = None
+
+LOG_FILE = 'corpus.log'
+ROTATED_LOG_FILE = 'corpus.log.1'
+SNAPSHOT_FILE = 'corpus.snapshot.json'
+LOCK_FILE = 'corpus.lock'
+COMPACT_LOCK_FILE = 'corpus.compact.lock'
+
+
+def encode_record(inputs_entry, responses_entry):
+    payload = json.dumps({"inputs": inputs_entry, "responses": responses_entry},
+                         ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return b'%08x ' % zlib.crc32(payload) + payload + b'\n'
+
+
+def decode_record(line):
+    line = line.rstrip(b'\n')
+    if len(line) < 10 or line[8:9] != b' ':
+        return None
+    payload = line[9:]
+    try:
+        if int(line[:8], 16) != zlib.crc32(payload):
+            return None
+        return json.loads(payload.decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class CorpusLog:
+    def __init__(self, directory='.', compact_every=1000, fsync=False):
+        self.directory = directory
+        self.log_path = os.path.join(directory, LOG_FILE)
+        self.rotated_path = os.path.join(directory, ROTATED_LOG_FILE)
+        self.snapshot_path = os.path.join(directory, SNAPSHOT_FILE)
+        self.binary_path = os.path.join(directory, BINARY_FILE)
+        self.lock_path = os.path.join(directory, LOCK_FILE)
+        self.compact_lock_path = os.path.join(directory, COMPACT_LOCK_FILE)
+        self.compact_every = compact_every
+        self.fsync = fsync
+        self.appends = 0
+        self.lock = threading.Lock()
+        self.compactor = None
+
+    @contextmanager
+    def _flock(self, path, mode, blocking=True):
+        with open(path, 'a') as f:
+            if fcntl is None:
+                yield True
+                return
+            flags = mode if blocking else mode | fcntl.LOCK_NB
+            try:
+                fcntl.flock(f, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _shared(self):
+        return self._flock(self.lock_path, fcntl.LOCK_SH if fcntl else 0)
+
+    def _exclusive(self, path=None, blocking=True):
+        return self._flock(path or self.lock_path, fcntl.LOCK_EX if fcntl else 0, blocking)
+
+    def exists(self):
+        return any(os.path.exists(p) for p in (self.binary_path, self.snapshot_path,
+                                               self.rotated_path, self.log_path))
+
+    def is_binary(self):
+        return os.path.exists(self.binary_path)
+
+    # ------------------- Recovery -------------------
+    def _read_snapshot(self):
+        # The mapped corpus loads in constant time; only the log tail is replayed
+        if self.is_binary():
+            return load_corpus(self.binary_path)
+        try:
+            with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+            return CorpusDict(snapshot["inputs"]), CorpusDict(snapshot["responses"])
+        except FileNotFoundError:
+            return CorpusDict(), CorpusDict()
+
+    def _replay(self, path, inputs, responses):
+        applied = skipped = 0
+        line = b'\n'
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            return 0
+        with f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = decode_record(line)
+                if record is None:
+                    # Torn tail from a crash mid-append, or a damaged record
+                    skipped += 1
+                    continue
+                if record.get("inputs"):
+                    key, value = record["inputs"]
+                    inputs[key] = value
+                if record.get("responses"):
+                    key, value = record["responses"]
+                    responses[key] = value
+                applied += 1
+        if not line.endswith(b'\n'):
+            # Terminate a torn tail so the next append starts on a fresh line
+            with open(path, 'ab') as f:
+                f.write(b'\n')
+        if skipped:
+            print(f"Skipped {skipped} damaged record(s) in {path}.")
+        return applied
+
+    def load(self):
+        # Holding the compaction lock keeps another process from swapping the
+        # snapshot between reading it and replaying the logs
+        with self._exclusive(self.compact_lock_path):
+            inputs, responses = self._read_snapshot()
+            self._replay(self.rotated_path, inputs, responses)
+            # Another process may be appending; a half-written record must
+            # not be mistaken for a torn tail
+            with self._exclusive():
+                self._replay(self.log_path, inputs, responses)
+        return inputs, responses
+
+    # ------------------- Writes -------------------
+    def append(self, inputs_entry=None, responses_entry=None):
+        record = encode_record(inputs_entry, responses_entry)
+        with self._shared():
+            with open(self.log_path, 'ab') as f:
+                f.write(record)
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+
+        with self.lock:
+            self.appends += 1
+            if self.compact_every and self.appends >= self.compact_every:
+                self.appends = 0
+                self.compact_in_background()
+
+    def _write_snapshot(self, inputs, responses, binary=None):
+        if binary is None:
+            binary = self.is_binary()
+
+        if binary:
+            # Processes that still map the old file keep reading its inode
+            tmp_path = self.binary_path + '.tmp'
+            write_corpus(tmp_path, inputs, responses)
+            os.replace(tmp_path, self.binary_path)
+            if os.path.exists(self.snapshot_path):
+                os.remove(self.snapshot_path)
+            return
+
+        tmp_path = self.snapshot_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"inputs": dict(inputs), "responses": dict(responses)}, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+    def write_snapshot(self, inputs, responses):
+        with self._exclusive(self.compact_lock_path):
+            self._write_snapshot(inputs, responses)
+
+    def replace(self, inputs, responses):
+        # The new snapshot is the whole corpus; nothing in the logs may be replayed over it
+        with self._exclusive(self.compact_lock_path), self._exclusive():
+            self._write_snapshot(inputs, responses)
+            for path in (self.rotated_path, self.log_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def files(self):
+        return [self.binary_path, self.snapshot_path, self.rotated_path, self.log_path]
+
+    def compact(self, binary=None):
+        # binary=True converts the snapshot to the memory-mapped format
+        with self._exclusive(self.compact_lock_path, blocking=False) as acquired:
+            if not acquired:
+                return False  # another process is already compacting
+
+            # A leftover rotated log means an earlier compaction died; fold it
+            # in first instead of overwriting it.
+            if not os.path.exists(self.rotated_path):
+                with self._exclusive():
+                    if os.path.exists(self.log_path):
+                        os.replace(self.log_path, self.rotated_path)
+                    elif binary is None:
+                        return False
+
+            inputs, responses = self._read_snapshot()
+            self._replay(self.rotated_path, inputs, responses)
+            self._write_snapshot(inputs, responses, binary)
+            if os.path.exists(self.rotated_path):
+                os.remove(self.rotated_path)
+        return True
+
+    def _compact_in_child(self):
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--compact'],
+                       cwd=self.directory, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL)
+
+    def compact_in_background(self):
+        if self.compactor is not None and self.compactor.is_alive():
+            return
+        # Compacting reads a second copy of the whole corpus. Freed, it still
+        # leaves the heap fragmented, so where flock keeps processes apart it
+        # runs in a short-lived child instead and this process doesn't grow.
+        target = self.compact if fcntl is None else self._compact_in_child
+        self.compactor = threading.Thread(target=target, daemon=True)
+        self.compactor.start()
+
+    # ------------------- Followers -------------------
+    def tail(self, apply, interval=0.2):
+        return LogTailer(self, apply, interval)
+
+    # ------------------- Compatibility -------------------
+    def export_json(self, inputs_path='inputs.json', responses_path='responses.json'):
+        inputs, responses = self.load()
+        with open(inputs_path, 'w') as f:
+            json.dump({"input": dict(inputs)}, f, ensure_ascii=False, indent=4)
+        with open(responses_path, 'w') as f:
+            json.dump({"input": dict(responses)}, f, ensure_ascii=False, indent=4)
+        return len(inputs), len(responses)
+
+
+class LogTailer:
+    # Applies records other processes append, following the log across
+    # compactions. Open it before load(): records appended in between are
+    # then applied twice, which is harmless, instead of not at all.
+    def __init__(self, corpus_log, apply, interval=0.2):
+        self.corpus_log = corpus_log
+        self.apply = apply
+        self.interval = interval
+        self.file = None
+        self.partial = b''
+        self._open(at_end=True)
+
+    def _open(self, at_end=False):
+        try:
+            self.file = open(self.corpus_log.log_path, 'rb')
+        except FileNotFoundError:
+            self.file = None
+            return
+        if at_end:
+            self.file.seek(0, os.SEEK_END)
+        self.partial = b''
+
+    def _rotated(self):
+        try:
+            return os.stat(self.corpus_log.log_path).st_ino != os.fstat(self.file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def poll(self):
+        applied = 0
+        while True:
+            if self.file is None:
+                self._open()
+                if self.file is None:
+                    return applied
+            # Check before reading: once renamed, the old log gets no more
+            # appends, so one more read drains it completely
+            rotated = self._rotated()
+            lines = (self.partial + self.file.read()).split(b'\n')
+            self.partial = lines.pop()
+            for line in lines:
+                record = decode_record(line) if line.strip() else None
+                if record is not None:
+                    self.apply(record)
+                    applied += 1
+            if not rotated:
+                return applied
+            self.file.close()
+            self._open()
+
+    def _follow(self):
+        while True:
+            try:
+                self.poll()
+            except Exception as e:
+                print(f"Corpus log tail error: {e}")
+            time.sleep(self.interval)
+
+    def start(self):
+        threading.Thread(target=self._follow, daemon=True).start()
+        return self
+
+
+def run_writer(records, directory='.', parent=None):
+    # The single process allowed to append in prefork mode. 'records' is a
+    # multiprocessing queue of (inputs entry, responses entry); None stops it.
+    # Ctrl-C reaches the whole process group; the writer drains the queue
+    # and stops on the None the supervisor sends once the workers are down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    corpus_log = CorpusLog(directory)
+    while True:
+        try:
+            record = records.get(timeout=1)
+        except queue.Empty:
+            if parent is not None and os.getppid() != parent:
+                return  # the supervisor is gone
+            continue
+        if record is None:
+            break
+        corpus_log.append(*record)
+    if corpus_log.compactor is not None:
+        corpus_log.compactor.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Maintain the append-only corpus log.')
+    parser.add_argument('--compact', action='store_true', help='Fold the log into the snapshot')
+    parser.add_argument('--export', action='store_true',
+                        help='Write inputs.json/responses.json in the legacy layout')
+    args = parser.parse_args()
+
+    corpus_log = CorpusLog()
+    if args.compact:
+        print("Compacted." if corpus_log.compact() else "Nothing to compact.")
+    if args.export:
+        inputs_count, responses_count = corpus_log.export_json()
+        print(f"Exported {inputs_count} inputs and {responses_count} responses.")
@@ -0,0 +1,297 @@
+import os
+import json
+import mmap
+import struct
+import argparse
+from array import array
+from collections.abc import Mapping, MutableMapping, Sequence
+
+BINARY_FILE = 'corpus.bin'
+
+# Layout (header little-endian, arrays in native byte order, 8-byte aligned):
+#   header
+#   string offsets   u64[strings + 1], relative to the blob
+#   string blob      UTF-8, every distinct string stored once
+#   inputs table     u32[inputs][2] (key id, meaning id) in insertion order
+#   inputs sorted    u32[inputs] entry numbers ordered by key bytes
+#   responses table and responses sorted, same as inputs
+# A {key: {"meaning": text}} entry beyond its characters: two str headers,
+# the inner dict and the slot (benchmarks/bench_memory_overhead.py)
+ENTRY_OVERHEAD = 300
+MAGIC = b'ALXC'
+VERSION = 1
+HEADER = struct.Struct('<4sIIII6Q')
+
+
+def entry_bytes(key, value):
+    return len(key) + len(value["meaning"]) + ENTRY_OVERHEAD
+
+
+def _align(f):
+    padding = -f.tell() % 8
+    f.write(b'\0' * padding)
+
+
+def _write_table(f, entries, strings):
+    position = f.tell()
+    f.write(array('I', (i for entry in entries for i in entry)).tobytes())
+    order = sorted(range(len(entries)), key=lambda n: strings[entries[n][0]])
+    f.write(array('I', order).tobytes())
+    _align(f)
+    return position
+
+
+def write_corpus(path, inputs, responses):
+    ids = {}
+    strings = []
+
+    def intern(text):
+        string_id = ids.get(text)
+        if string_id is None:
+            string_id = ids[text] = len(strings)
+            strings.append(text.encode('utf-8'))
+        return string_id
+
+    input_entries = [(intern(key), intern(value["meaning"])) for key, value in inputs.items()]
+    response_entries = [(intern(key), intern(value["meaning"])) for key, value in responses.items()]
+
+    with open(path, 'wb') as f:
+        f.write(b'\0' * HEADER.size)
+        _align(f)
+
+        offsets_pos = f.tell()
+        offset = 0
+        offsets = array('Q', [0])
+        for encoded in strings:
+            offset += len(encoded)
+            offsets.append(offset)
+        f.write(offsets.tobytes())
+
+        blob_pos = f.tell()
+        for encoded in strings:
+            f.write(encoded)
+        _align(f)
+
+        inputs_pos = _write_table(f, input_entries, strings)
+        responses_pos = _write_table(f, response_entries, strings)
+        end = f.tell()
+
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, len(strings), len(input_entries), len(response_entries),
+                            offsets_pos, blob_pos, inputs_pos, responses_pos, end, 0))
+        f.flush()
+        os.fsync(f.fileno())
+    return len(strings)
+
+
+class CorpusFile:
+    def __init__(self, path=BINARY_FILE):
+        self.path = path
+        with open(path, 'rb') as f:
+            # Read-only and shared: server and client map the same page cache
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, string_count, input_count, response_count,
+         offsets_pos, blob_pos, inputs_pos, responses_pos, _, _) = HEADER.unpack_from(self.mm)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} corpus file")
+
+        data = memoryview(self.mm)
+        self.offsets = data[offsets_pos:offsets_pos + 8 * (string_count + 1)].cast('Q')
+        self.blob = data[blob_pos:]
+        self.string_count = string_count
+        self.inputs = CorpusView(self, data, inputs_pos, input_count)
+        self.responses = CorpusView(self, data, responses_pos, response_count)
+
+    def release(self):
+        # The pages are clean: dropping them costs a page cache fault later
+        if hasattr(mmap, 'MADV_DONTNEED'):
+            self.mm.madvise(mmap.MADV_DONTNEED)
+
+    def string_bytes(self, string_id):
+        return self.blob[self.offsets[string_id]:self.offsets[string_id + 1]]
+
+    def string(self, string_id):
+        return str(self.string_bytes(string_id), 'utf-8')
+
+
+class CorpusView(Mapping):
+    # Read-only {key: {"meaning": ...}} view straight over the mapped file
+    def __init__(self, corpus, data, position, count):
+        self.corpus = corpus
+        self.count = count
+        self.entries = data[position:position + 8 * count].cast('I')
+        self.sorted = data[position + 8 * count:position + 12 * count].cast('I')
+
+    def __len__(self):
+        return self.count
+
+    def key_at(self, n):
+        return self.corpus.string(self.entries[2 * n])
+
+    def value_at(self, n):
+        return {"meaning": self.corpus.string(self.entries[2 * n + 1])}
+
+    def _find(self, key):
+        target = key.encode('utf-8')
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            n = self.sorted[middle]
+            if bytes(self.corpus.string_bytes(self.entries[2 * n])) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            n = self.sorted[low]
+            if bytes(self.corpus.string_bytes(self.entries[2 * n])) == target:
+                return n
+        return None
+
+    def __getitem__(self, key):
+        n = self._find(key) if isinstance(key, str) else None
+        if n is None:
+            raise KeyError(key)
+        return self.value_at(n)
+
+    def __contains__(self, key):
+        return isinstance(key, str) and self._find(key) is not None
+
+    def __iter__(self):
+        for n in range(self.count):
+            yield self.key_at(n)
+
+    def values(self):
+        return CorpusValues(self)
+
+
+class CorpusValues(Sequence):
+    # Indexable, so random.choice() needs no list copy
+    def __init__(self, corpus):
+        self.corpus = corpus
+
+    def __len__(self):
+        return len(self.corpus)
+
+    def __getitem__(self, n):
+        if isinstance(n, slice):
+            return [self[i] for i in range(*n.indices(len(self)))]
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError(n)
+        return self.corpus.value_at(n)
+
+
+class CorpusDict(dict):
+    # In-memory corpus that keeps a running count of the heap it holds
+    def __init__(self, entries=()):
+        super().__init__(entries)
+        self.heap_bytes = sum(entry_bytes(key, value) for key, value in self.items())
+
+    def __setitem__(self, key, value):
+        if key in self:
+            self.heap_bytes -= entry_bytes(key, dict.__getitem__(self, key))
+        super().__setitem__(key, value)
+        self.heap_bytes += entry_bytes(key, value)
+
+    def __delitem__(self, key):
+        self.heap_bytes -= entry_bytes(key, dict.__getitem__(self, key))
+        super().__delitem__(key)
+
+    def update(self, entries=(), **kwargs):
+        for key, value in dict(entries, **kwargs).items():
+            self[key] = value
+
+
+class CorpusOverlay(MutableMapping):
+    # Mapped base plus the entries learned since it was written. Keeps dict
+    # semantics: updating a key keeps its place, new keys go to the end.
+    def __init__(self, base):
+        self.base = base
+        self.changes = {}
+        self.added = []
+        self.heap_bytes = 0  # held by the learned entries
+
+    def __len__(self):
+        return len(self.base) + len(self.added)
+
+    def __contains__(self, key):
+        return key in self.changes or key in self.base
+
+    def __getitem__(self, key):
+        if key in self.changes:
+            return self.changes[key]
+        return self.base[key]
+
+    def __setitem__(self, key, value):
+        if key in self.changes:
+            self.heap_bytes -= entry_bytes(key, self.changes[key])
+        elif key not in self.base:
+            self.added.append(key)
+        self.changes[key] = value
+        self.heap_bytes += entry_bytes(key, value)
+
+    def __delitem__(self, key):
+        raise TypeError("Corpus entries can't be deleted")
+
+    def __iter__(self):
+        yield from self.base
+        yield from self.added
+
+    def key_at(self, n):
+        if n < len(self.base):
+            return self.base.key_at(n)
+        return self.added[n - len(self.base)]
+
+    def value_at(self, n):
+        return self[self.key_at(n)]
+
+    def values(self):
+        return CorpusValues(self)
+
+
+def memory_bytes(inputs, responses):
+    # Heap held by the corpus; a mapped one adds its file size, an upper
+    # bound on the pages resident for it
+    total = 0
+    mapped = set()
+    for entries in (inputs, responses):
+        if isinstance(entries, CorpusOverlay):
+            mapped.add(entries.base.corpus)
+        total += entries.heap_bytes
+    return total + sum(len(corpus.mm) for corpus in mapped)
+
+
+def release_pages(inputs, responses):
+    # Learned entries can't be dropped; only mapped pages can go
+    for entries in (inputs, responses):
+        if isinstance(entries, CorpusOverlay):
+            entries.base.corpus.release()
+
+
+def load_corpus(path=BINARY_FILE):
+    corpus = CorpusFile(path)
+    return CorpusOverlay(corpus.inputs), CorpusOverlay(corpus.responses)
+
+
+if __name__ == "__main__":
+    from corpus_log import CorpusLog
+
+    parser = argparse.ArgumentParser(description='Convert the learned corpus to the memory-mapped format.')
+    parser.add_argument('--inputs', default='inputs.json')
+    parser.add_argument('--responses', default='responses.json')
+    args = parser.parse_args()
+
+    corpus_log = CorpusLog()
+    if corpus_log.exists():
+        corpus_log.compact(binary=True)
+    else:
+        with open(args.inputs, 'r') as f:
+            inputs = json.load(f)['input']
+        with open(args.responses, 'r') as f:
+            responses = json.load(f)['input']
+        write_corpus(corpus_log.binary_path, inputs, responses)
+
+    corpus = CorpusFile(corpus_log.binary_path)
+    print(f"Wrote {corpus_log.binary_path}: {len(corpus.inputs)} inputs, "
+          f"{len(corpus.responses)} responses, {corpus.string_count} distinct strings.")
@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import time
+import zlib
+import hashlib
+import argparse
+import threading
+import subprocess
+from datetime import datetime, timezone
+from corpus_log import CorpusLog
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+BACKUP_DIR = 'killme'
+CHUNK_MASK = 0xFF          # a chunk ends after about one entry in 256
+MAX_CHUNK = 1024 * 1024
+KEEP_LAST = 10
+KEEP_DAILY = 7
+
+
+def corpus_lines(inputs, responses):
+    # Insertion order: new entries land at the end, so old chunks repeat
+    for kind, entries in (("inputs", inputs), ("responses", responses)):
+        for key, value in entries.items():
+            yield json.dumps([kind, key, value], ensure_ascii=False,
+                             separators=(',', ':')).encode('utf-8') + b'\n'
+
+
+def chunk_lines(lines):
+    # Boundaries depend on the entries, not on offsets: an entry added or
+    # changed only alters the chunk it falls into
+    chunk, size = [], 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if zlib.crc32(line) & CHUNK_MASK == 0 or size >= MAX_CHUNK:
+            yield b''.join(chunk)
+            chunk, size = [], 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+def snapshot_id(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+
+
+class SnapshotStore:
+    # Point-in-time copies of the learned corpus. Each snapshot is a manifest
+    # listing content-addressed chunks; a chunk already stored by an earlier
+    # snapshot is not written again, so a snapshot costs about the entries
+    # added since the last one.
+    def __init__(self, directory=BACKUP_DIR, corpus_directory='.'):
+        self.directory = directory
+        self.chunks_dir = os.path.join(directory, 'chunks')
+        self.manifests_dir = os.path.join(directory, 'snapshots')
+        self.lock_path = os.path.join(directory, 'snapshot.lock')
+        self.corpus_log = CorpusLog(corpus_directory)
+        os.makedirs(self.chunks_dir, exist_ok=True)
+        os.makedirs(self.manifests_dir, exist_ok=True)
+
+    def _lock(self):
+        f = open(self.lock_path, 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                return None
+        return f
+
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def _write_chunk(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if os.path.exists(path):
+            return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(data)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(compressed)
+        os.replace(path + '.tmp', path)
+        return digest, len(compressed)
+
+    def create(self):
+        # load() reads the snapshot and both logs under the corpus locks, so
+        # concurrent appends are either wholly in this snapshot or not at all
+        lock = self._lock()
+        if lock is None:
+            return None  # another process is taking one right now
+        with lock:
+            started = time.time()
+            inputs, responses = self.corpus_log.load()
+            chunks = []
+            written = 0
+            for data in chunk_lines(corpus_lines(inputs, responses)):
+                digest, size = self._write_chunk(data)
+                chunks.append(digest)
+                written += size
+
+            snapshots = self.snapshots()
+            if snapshots and snapshots[-1]["chunks"] == chunks:
+                return None  # nothing learned since the last one
+
+            manifest = {"id": snapshot_id(started), "created": started, "inputs": len(inputs),
+                        "responses": len(responses), "chunks": chunks, "written_bytes": written}
+            path = os.path.join(self.manifests_dir, manifest["id"] + '.json')
+            with open(path + '.tmp', 'w') as f:
+                json.dump(manifest, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+            return manifest
+
+    def snapshots(self):
+        manifests = []
+        for name in sorted(os.listdir(self.manifests_dir)):
+            if name.endswith('.json'):
+                with open(os.path.join(self.manifests_dir, name)) as f:
+                    manifests.append(json.load(f))
+        return manifests
+
+    def find(self, snapshot=None, at=None):
+        # The snapshot with this id, or the last one taken at or before 'at'
+        candidates = self.snapshots()
+        if snapshot is not None:
+            candidates = [m for m in candidates if m["id"] == snapshot]
+        if at is not None:
+            candidates = [m for m in candidates if m["created"] <= at]
+        return candidates[-1] if candidates else None
+
+    def read(self, manifest):
+        inputs, responses = {}, {}
+        entries = {"inputs": inputs, "responses": responses}
+        for digest in manifest["chunks"]:
+            with open(self._chunk_path(digest), 'rb') as f:
+                data = zlib.decompress(f.read())
+            for line in data.splitlines():
+                kind, key, value = json.loads(line)
+                entries[kind][key] = value
+        return inputs, responses
+
+    def restore(self, snapshot=None, at=None):
+        # Only while no server or client is running: they keep their own copy
+        manifest = self.find(snapshot, at)
+        if manifest is None:
+            return None
+        inputs, responses = self.read(manifest)
+        self.create()  # the state being replaced stays restorable
+        self.corpus_log.replace(inputs, responses)
+        return manifest
+
+    def prune(self, keep_last=KEEP_LAST, keep_daily=KEEP_DAILY):
+        # Keeps the newest 'keep_last' snapshots plus the last one of each of
+        # the newest 'keep_daily' days, then drops chunks nothing refers to
+        lock = self._lock()
+        if lock is None:
+            return None
+        with lock:
+            snapshots = self.snapshots()
+            keep = {m["id"] for m in snapshots[-keep_last:]} if keep_last else set()
+            days = {}
+            for manifest in snapshots:
+                days[time.strftime('%Y-%m-%d', time.localtime(manifest["created"]))] = manifest["id"]
+            if keep_daily:
+                keep.update(snapshot for _, snapshot in sorted(days.items())[-keep_daily:])
+
+            removed = 0
+            for manifest in snapshots:
+                if manifest["id"] not in keep:
+                    os.remove(os.path.join(self.manifests_dir, manifest["id"] + '.json'))
+                    removed += 1
+
+            live = {digest for manifest in snapshots if manifest["id"] in keep
+                    for digest in manifest["chunks"]}
+            freed = 0
+            for prefix in os.listdir(self.chunks_dir):
+                for name in os.listdir(os.path.join(self.chunks_dir, prefix)):
+                    if name not in live:
+                        path = os.path.join(self.chunks_dir, prefix, name)
+                        freed += os.path.getsize(path)
+                        os.remove(path)
+            return removed, freed
+
+    def stats(self):
+        snapshots = self.snapshots()
+        stored = 0
+        for prefix in os.listdir(self.chunks_dir):
+            for name in os.listdir(os.path.join(self.chunks_dir, prefix)):
+                stored += os.path.getsize(os.path.join(self.chunks_dir, prefix, name))
+        return {"snapshots": len(snapshots), "stored_bytes": stored,
+                "latest": snapshots[-1]["id"] if snapshots else None}
+
+
+class SnapshotScheduler:
+    # Takes snapshots in a separate, niced process so a turn only pays for
+    # starting it. At most one runs at a time, no more often than every
+    # 'interval' seconds, and only when the corpus files have changed.
+    def __init__(self, directory=BACKUP_DIR, interval=300, corpus_directory='.'):
+        self.directory = directory
+        self.interval = interval
+        self.corpus_directory = corpus_directory
+        self.corpus_log = CorpusLog(corpus_directory)
+        self.process = None
+        self.last = time.monotonic()  # what is on disk at startup is already safe
+        self.signature = None
+        self.lock = threading.Lock()
+
+    def _signature(self):
+        signature = []
+        for path in self.corpus_log.files():
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_size, stat.st_mtime_ns))
+            except FileNotFoundError:
+                pass
+        return signature
+
+    def request(self, force=False):
+        with self.lock:
+            if self.process is not None:
+                if self.process.poll() is None:
+                    return False
+                self.process = None
+            now = time.monotonic()
+            if not force and (not self.interval or now - self.last < self.interval):
+                return False
+            signature = self._signature()
+            if not force and signature == self.signature:
+                return False
+            self.last = now
+            self.signature = signature
+            self.process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), '--directory', self.directory,
+                 '--nice', '10', 'create', '--prune'],
+                cwd=self.corpus_directory, stdin=subprocess.DEVNULL)
+            return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Incremental snapshots of the learned corpus.')
+    parser.add_argument('--directory', default=BACKUP_DIR)
+    parser.add_argument('--nice', type=int, default=0, help='Lower this process priority by N')
+    commands = parser.add_subparsers(dest='command', required=True)
+    create = commands.add_parser('create', help='Take a snapshot now')
+    create.add_argument('--prune', action='store_true', help='Apply the retention policy afterwards')
+    commands.add_parser('list', help='List snapshots')
+    restore = commands.add_parser('restore', help='Replace the corpus with a snapshot; stop the server first')
+    restore.add_argument('snapshot', nargs='?', help='Snapshot id (default: the latest)')
+    restore.add_argument('--at', help='Latest snapshot taken at or before this local time, '
+                                      'e.g. 2026-10-18T14:30')
+    prune = commands.add_parser('prune', help='Apply the retention policy')
+    for command in (create, prune):
+        command.add_argument('--keep-last', type=int, default=KEEP_LAST)
+        command.add_argument('--keep-daily', type=int, default=KEEP_DAILY)
+    args = parser.parse_args()
+
+    if args.nice:
+        os.nice(args.nice)
+    store = SnapshotStore(args.directory)
+    if args.command == 'create':
+        manifest = store.create()
+        if manifest:
+            print(f"Snapshot {manifest['id']}: {manifest['inputs']} inputs, {manifest['responses']} "
+                  f"responses, {manifest['written_bytes']} new bytes")
+        if args.prune:
+            store.prune(args.keep_last, args.keep_daily)
+    elif args.command == 'list':
+        for manifest in store.snapshots():
+            created = datetime.fromtimestamp(manifest["created"]).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"{manifest['id']}  {created}  {manifest['inputs']} inputs  "
+                  f"{manifest['responses']} responses")
+        print(store.stats())
+    elif args.command == 'restore':
+        at = datetime.fromisoformat(args.at).timestamp() if args.at else None
+        manifest = store.restore(args.snapshot, at)
+        print(f"Restored {manifest['id']}." if manifest else "No such snapshot.")
+    elif args.command == 'prune':
+        result = store.prune(args.keep_last, args.keep_daily)
+        if result:
+            print(f"Removed {result[0]} snapshot(s), freed {result[1]} bytes.")
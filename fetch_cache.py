@@ -0,0 +1,161 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+CACHE_FILE = 'fetch_cache.db'
+MISS = object()
+
+DAY = 24 * 60 * 60
+DEFAULT_TTLS = {
+    "wikipedia_sentences": 7 * DAY,
+    "wikipedia": 7 * DAY,
+    "duckduckgo": DAY,
+    "wikidata": DAY,
+    "ddg_abstract": DAY,
+    "wikidata_description": DAY,
+}
+DEFAULT_TTL = DAY
+NEGATIVE_TTL = 60 * 60
+
+
+class FetchCache:
+    def __init__(self, path=CACHE_FILE, max_bytes=64 * 1024 * 1024, ttls=None,
+                 negative_ttl=NEGATIVE_TTL, page_cache_kib=8 * 1024, timeout=5.0):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.page_cache_bytes = int(page_cache_kib * 1024)
+        self.ttls = dict(DEFAULT_TTLS, **(ttls or {}))
+        self.negative_ttl = negative_ttl
+        self.counters = Counter()
+        self.lock = threading.Lock()
+        self.puts = 0
+
+        # WAL lets the server and the client read while the other one writes
+        self.db = sqlite3.connect(path, timeout=timeout, check_same_thread=False,
+                                  isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(f"PRAGMA cache_size=-{int(page_cache_kib)}")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                source TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                negative INTEGER NOT NULL,
+                expires REAL NOT NULL,
+                accessed REAL NOT NULL,
+                PRIMARY KEY (source, key)
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+
+    def get(self, source, key, default=MISS):
+        now = time.time()
+        try:
+            with self.lock:
+                row = self.db.execute(
+                    "SELECT value, negative, expires FROM entries WHERE source = ? AND key = ?",
+                    (source, key)).fetchone()
+                if row is not None and row[2] <= now:
+                    self.db.execute("DELETE FROM entries WHERE source = ? AND key = ?", (source, key))
+                    self.counters[f"{source}.expired"] += 1
+                    row = None
+                if row is None:
+                    self.counters[f"{source}.misses"] += 1
+                    return default
+                self.db.execute("UPDATE entries SET accessed = ? WHERE source = ? AND key = ?",
+                                (now, source, key))
+                self.counters[f"{source}.negative_hits" if row[1] else f"{source}.hits"] += 1
+        except sqlite3.Error as e:
+            # A busy or broken cache must never fail the turn
+            print(f"Cache error: {e}")
+            self.counters[f"{source}.errors"] += 1
+            return default
+        return json.loads(row[0])
+
+    def contains(self, source, key):
+        # Peek without touching LRU order or the hit/miss counters
+        try:
+            with self.lock:
+                row = self.db.execute(
+                    "SELECT 1 FROM entries WHERE source = ? AND key = ? AND expires > ?",
+                    (source, key, time.time())).fetchone()
+        except sqlite3.Error:
+            return False
+        return row is not None
+
+    def put(self, source, key, value, negative=False):
+        now = time.time()
+        ttl = self.negative_ttl if negative else self.ttls.get(source, DEFAULT_TTL)
+        encoded = json.dumps(value, ensure_ascii=False)
+        try:
+            with self.lock:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (source, key, encoded, len(encoded), int(negative), now + ttl, now))
+                self.puts += 1
+                if self.puts % 50 == 0:
+                    self._evict()
+        except sqlite3.Error as e:
+            print(f"Cache error: {e}")
+            self.counters[f"{source}.errors"] += 1
+        return value
+
+    def put_negative(self, source, key, value=None):
+        return self.put(source, key, value, negative=True)
+
+    def _evict(self):
+        now = time.time()
+        self.db.execute("DELETE FROM entries WHERE expires <= ?", (now,))
+        total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Drop least recently used entries until 90% of the cap is free again
+        excess = total - int(self.max_bytes * 0.9)
+        freed = 0
+        evicted = []
+        for source, key, size in self.db.execute(
+                "SELECT source, key, size FROM entries ORDER BY accessed"):
+            evicted.append((source, key))
+            freed += size
+            if freed >= excess:
+                break
+        self.db.executemany("DELETE FROM entries WHERE source = ? AND key = ?", evicted)
+        self.counters["evictions"] += len(evicted)
+
+    def evict(self):
+        with self.lock:
+            self._evict()
+
+    def size(self):
+        with self.lock:
+            return self.db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+    def memory_bytes(self):
+        # The entries live on disk; in memory there is at most SQLite's page cache
+        return self.page_cache_bytes
+
+    def shrink(self, fraction):
+        # Nothing is lost: the pages are read back from the database file.
+        # SQLite doesn't say how much that was.
+        try:
+            with self.lock:
+                self.db.execute("PRAGMA shrink_memory")
+        except sqlite3.Error as e:
+            print(f"Cache error: {e}")
+        return None
+
+    def stats(self):
+        entries, stored_bytes = self.size()
+        stats = dict(self.counters)
+        stats["entries"] = entries
+        stats["bytes"] = stored_bytes
+        return stats
+
+    def close(self):
+        with self.lock:
+            self.db.close()
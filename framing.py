@@ -0,0 +1,180 @@
+import struct
+import asyncio
+
+# Every frame is: version byte, kind byte, 4-byte big-endian payload length,
+# then the UTF-8 payload. Messages no longer depend on recv() boundaries.
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct('!BBI')
+MAX_FRAME_SIZE = 1024 * 1024
+
+MESSAGE = 0
+# A streamed message: CHUNK frames as the parts become ready, then an empty
+# END frame. Readers that want the whole message get the chunks joined.
+CHUNK = 1
+END = 2
+# Sent instead of a reply, or in the middle of a streamed one, when the
+# sender failed and is closing the connection; the payload says why
+ERROR = 3
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class RemoteError(Exception):
+    pass
+
+
+def encode_frame(text, kind=MESSAGE):
+    payload = text.encode('utf-8')
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Frame of {len(payload)} bytes exceeds {MAX_FRAME_SIZE}")
+    return HEADER.pack(PROTOCOL_VERSION, kind, len(payload)) + payload
+
+
+def parse_header(data, offset=0):
+    version, kind, length = HEADER.unpack_from(data, offset)
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Frame of {length} bytes exceeds {MAX_FRAME_SIZE}")
+    return kind, length
+
+
+def send_message(sock, text, kind=MESSAGE):
+    sock.sendall(encode_frame(text, kind))
+
+
+def join_chunks(chunks):
+    return ' '.join(chunks)
+
+
+def send_messages(sock, texts, kind=MESSAGE):
+    # Pipelined: all frames leave in one write, replies are read afterwards
+    sock.sendall(b''.join(encode_frame(text, kind) for text in texts))
+
+
+class FrameReader:
+    def __init__(self, sock, buffer_size=64 * 1024):
+        self.sock = sock
+        self.buffer = bytearray(buffer_size)
+        self.view = memoryview(self.buffer)
+        self.start = 0
+        self.end = 0
+
+    def _next_frame(self):
+        available = self.end - self.start
+        if available < HEADER.size:
+            return None
+        kind, length = parse_header(self.buffer, self.start)
+        if available < HEADER.size + length:
+            return None
+        payload_start = self.start + HEADER.size
+        self.start = payload_start + length
+        return kind, str(self.view[payload_start:self.start], 'utf-8')
+
+    def _make_room(self):
+        # Move the unread tail to the front so the same buffer is reused;
+        # only frames larger than the buffer force a bigger one.
+        pending = self.end - self.start
+        needed = HEADER.size
+        if pending >= HEADER.size:
+            needed += parse_header(self.buffer, self.start)[1]
+        if needed > len(self.buffer):
+            buffer = bytearray(needed)
+            buffer[:pending] = self.view[self.start:self.end]
+            self.view.release()
+            self.buffer = buffer
+            self.view = memoryview(self.buffer)
+        elif self.start:
+            self.buffer[:pending] = bytes(self.view[self.start:self.end])
+        self.start = 0
+        self.end = pending
+
+    def read_frame(self):
+        while True:
+            frame = self._next_frame()
+            if frame is not None:
+                return frame
+            if self.end == len(self.buffer) or self.start:
+                self._make_room()
+            received = self.sock.recv_into(self.view[self.end:])
+            if not received:
+                if self.end != self.start:
+                    raise ProtocolError("Connection closed in the middle of a frame")
+                return None
+            self.end += received
+
+    def read_parts(self):
+        # Yields a message's text as it arrives: one part for a MESSAGE
+        # frame, one per CHUNK of a streamed one
+        frame = self.read_frame()
+        if frame is None:
+            return
+        kind, text = frame
+        if kind != CHUNK:
+            if kind == ERROR:
+                raise RemoteError(text)
+            yield text
+            return
+        while kind == CHUNK:
+            yield text
+            frame = self.read_frame()
+            if frame is None:
+                raise ProtocolError("Connection closed in the middle of a streamed message")
+            kind, text = frame
+        if kind == ERROR:
+            raise RemoteError(text)
+        if kind != END:
+            raise ProtocolError(f"Unexpected frame kind {kind} in a streamed message")
+
+    def read_message(self):
+        parts = list(self.read_parts())
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else join_chunks(parts)
+
+    def __iter__(self):
+        while True:
+            message = self.read_message()
+            if message is None:
+                return
+            yield message
+
+
+async def read_frame_async(reader):
+    try:
+        header = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ProtocolError("Connection closed in the middle of a frame")
+        return None
+    kind, length = parse_header(header)
+    try:
+        payload = await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ProtocolError("Connection closed in the middle of a frame")
+    return kind, payload.decode('utf-8')
+
+
+async def read_message_async(reader):
+    frame = await read_frame_async(reader)
+    if frame is None:
+        return None
+    kind, text = frame
+    if kind == ERROR:
+        raise RemoteError(text)
+    if kind != CHUNK:
+        return text
+    chunks = []
+    while kind == CHUNK:
+        chunks.append(text)
+        frame = await read_frame_async(reader)
+        if frame is None:
+            raise ProtocolError("Connection closed in the middle of a streamed message")
+        kind, text = frame
+    if kind == ERROR:
+        raise RemoteError(text)
+    if kind != END:
+        raise ProtocolError(f"Unexpected frame kind {kind} in a streamed message")
+    return join_chunks(chunks)
@@ -0,0 +1,69 @@
+import codecs
+from collections import deque
+from html.parser import HTMLParser
+
+CHUNK_SIZE = 16 * 1024
+
+
+class ParagraphParser(HTMLParser):
+    # Collects the text of each <p> (nested tags included, like BeautifulSoup's
+    # p.text) and hands it out as soon as the paragraph closes.
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.in_paragraph = False
+        self.parts = []
+        self.ready = deque()
+
+    def _finish(self):
+        self.ready.append(''.join(self.parts))
+        self.parts = []
+        self.in_paragraph = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'p':
+            if self.in_paragraph:
+                self._finish()
+            self.in_paragraph = True
+
+    def handle_endtag(self, tag):
+        if tag == 'p' and self.in_paragraph:
+            self._finish()
+
+    def handle_data(self, data):
+        if self.in_paragraph:
+            self.parts.append(data)
+
+    def flush(self):
+        if self.in_paragraph:
+            self._finish()
+
+
+def iter_paragraphs(chunks, encoding='utf-8'):
+    decoder = codecs.getincrementaldecoder(encoding or 'utf-8')(errors='replace')
+    parser = ParagraphParser()
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        while parser.ready:
+            yield parser.ready.popleft()
+
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    parser.flush()
+    while parser.ready:
+        yield parser.ready.popleft()
+
+
+def response_encoding(response):
+    if 'charset' in response.headers.get('content-type', ''):
+        return response.encoding
+    return 'utf-8'
+
+
+def iter_response_paragraphs(response, chunk_size=CHUNK_SIZE):
+    # Only the part of the body the caller consumes is ever downloaded
+    return iter_paragraphs(response.iter_content(chunk_size), response_encoding(response))
+
+
+def iter_bytes(content, chunk_size=CHUNK_SIZE):
+    for start in range(0, len(content), chunk_size):
+        yield content[start:start + chunk_size]
@@ -0,0 +1,146 @@
+import os
+import random
+import threading
+import time
+import weakref
+from urllib.parse import urlsplit, urlunsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import METRICS
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+    # Token bucket: 'rate' requests per second with bursts up to 'burst'
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HttpClient:
+    def __init__(self, max_concurrency=16, pool_hosts=10, pool_size=10, default_rate=10,
+                 rate_limits=None, retries=2, backoff=0.3, max_backoff=5.0,
+                 timeout=10, transport=None, host_overrides=None):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.default_rate = default_rate
+        self.rate_limits = dict(rate_limits or {})
+        self.host_overrides = dict(host_overrides or {})
+        self.limiters = {}
+        self.limiters_lock = threading.Lock()
+        self.semaphore = threading.BoundedSemaphore(max_concurrency)
+
+        # One session, so every fetcher shares keep-alive connections; the
+        # adapter keeps a separate pool per host. 'transport' swaps in any
+        # requests adapter, e.g. one that answers from local fixtures.
+        self.session = requests.Session()
+        adapter = transport or HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    @classmethod
+    def from_env(cls, **kwargs):
+        # ALEXANDRIAN_HOST_OVERRIDES="en.wikipedia.org=http://127.0.0.1:8001,..."
+        # points the fetchers at a local stub server for offline runs.
+        overrides = {}
+        for item in os.environ.get('ALEXANDRIAN_HOST_OVERRIDES', '').split(','):
+            if '=' in item:
+                host, target = item.split('=', 1)
+                overrides[host.strip()] = target.strip()
+        kwargs.setdefault('host_overrides', overrides)
+        if 'ALEXANDRIAN_HTTP_RETRIES' in os.environ:
+            kwargs.setdefault('retries', int(os.environ['ALEXANDRIAN_HTTP_RETRIES']))
+        if 'ALEXANDRIAN_HTTP_CONCURRENCY' in os.environ:
+            kwargs.setdefault('max_concurrency', int(os.environ['ALEXANDRIAN_HTTP_CONCURRENCY']))
+        if 'ALEXANDRIAN_HTTP_RATE' in os.environ:
+            kwargs.setdefault('default_rate', float(os.environ['ALEXANDRIAN_HTTP_RATE']))
+        return cls(**kwargs)
+
+    def _rewrite(self, url):
+        parts = urlsplit(url)
+        target = self.host_overrides.get(parts.netloc)
+        if not target:
+            return url
+        target = urlsplit(target)
+        return urlunsplit((target.scheme, target.netloc, target.path.rstrip('/') + parts.path,
+                           parts.query, parts.fragment))
+
+    def _limiter(self, host):
+        with self.limiters_lock:
+            limiter = self.limiters.get(host)
+            if limiter is None:
+                limiter = RateLimiter(self.rate_limits.get(host, self.default_rate))
+                self.limiters[host] = limiter
+            return limiter
+
+    def _sleep_before_retry(self, attempt):
+        # Full jitter keeps server and client from retrying in lockstep
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt)))
+
+    def _hold(self, response):
+        # A streamed body is read after get() returns, so the response keeps
+        # its concurrency slot until it is closed, or collected unclosed
+        release = weakref.finalize(response, self.semaphore.release)
+        close = response.close
+
+        def close_and_release():
+            try:
+                close()
+            finally:
+                release()  # a finalizer runs at most once
+
+        response.close = close_and_release
+        return response
+
+    def get(self, url, params=None, timeout=None, stream=False):
+        host = urlsplit(url).netloc
+        url = self._rewrite(url)
+        limiter = self._limiter(urlsplit(url).netloc)
+        timeout = self.timeout if timeout is None else timeout
+
+        for attempt in range(self.retries + 1):
+            with METRICS.span('rate_limit_wait', host=host):
+                limiter.acquire()
+            self.semaphore.acquire()
+            try:
+                with METRICS.span('http', host=host):
+                    response = self.session.get(url, params=params, timeout=timeout, stream=stream)
+            except (requests.ConnectionError, requests.Timeout):
+                self.semaphore.release()
+                if attempt == self.retries:
+                    raise
+            except BaseException:
+                self.semaphore.release()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                    if stream:
+                        return self._hold(response)
+                    self.semaphore.release()
+                    return response
+                response.close()
+                self.semaphore.release()
+            self._sleep_before_retry(attempt)
+
+    def close(self):
+        self.session.close()
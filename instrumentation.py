@@ -0,0 +1,221 @@
+import functools
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Histogram:
+    # HDR-style log-linear buckets: each power of two is split into
+    # 2**SUB_BITS sub-buckets, so any recorded value is off by at most ~6%.
+    SUB_BITS = 4
+
+    def __init__(self):
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    def _bucket(self, value):
+        shift = value.bit_length() - self.SUB_BITS - 1
+        if shift <= 0:
+            return value
+        return ((shift + 1) << self.SUB_BITS) + (value >> shift) - (1 << self.SUB_BITS)
+
+    def _bucket_value(self, bucket):
+        if bucket < 2 << self.SUB_BITS:
+            return bucket
+        shift = (bucket >> self.SUB_BITS) - 1
+        return (bucket - (shift << self.SUB_BITS)) << shift
+
+    def record(self, value):
+        value = max(0, int(value))
+        bucket = self._bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self.min = value if self.min is None else min(self.min, value)
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        rank = p / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(self._bucket_value(bucket), self.max)
+        return self.max
+
+
+class Span:
+    __slots__ = ('metrics', 'stage', 'tags', 'start')
+
+    def __init__(self, metrics, stage, tags):
+        self.metrics = metrics
+        self.stage = stage
+        self.tags = tags
+
+    def tag(self, **tags):
+        self.tags.update(tags)
+
+    def __enter__(self):
+        self.metrics._stack().append(self)
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        elapsed = time.perf_counter_ns() - self.start
+        stack = self.metrics._stack()
+        # Coroutines interleave spans on one thread, so this may not be on top
+        if stack and stack[-1] is self:
+            stack.pop()
+        elif self in stack:
+            stack.remove(self)
+        if exc_type is not None:
+            self.tags['error'] = exc_type.__name__
+        self.metrics.record(self.stage, self.tags, elapsed)
+        return False
+
+
+class NullSpan:
+    # Shared no-op returned while metrics are off, so a disabled span costs
+    # one attribute check and no allocation.
+    def tag(self, **tags):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Metrics:
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = time.time()
+
+    def _stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    def span(self, stage, **tags):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, stage, tags)
+
+    def tag(self, **tags):
+        # Tags the innermost open span of this thread, e.g. cache=hit
+        if self.enabled:
+            stack = self._stack()
+            if stack:
+                stack[-1].tags.update(tags)
+
+    def timed(self, stage, **tags):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                with Span(self, stage, dict(tags)):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def record(self, stage, tags, elapsed_ns):
+        key = stage
+        if tags:
+            key += '{' + ','.join(f'{k}={v}' for k, v in sorted(tags.items())) + '}'
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            # Microseconds keep the bucket count small for second-long fetches
+            histogram.record(elapsed_ns // 1000)
+
+    def snapshot(self):
+        with self.lock:
+            stages = {}
+            for key, h in sorted(self.histograms.items()):
+                stages[key] = {
+                    "count": h.count,
+                    "mean_ms": h.total / h.count / 1000 if h.count else 0,
+                    "min_ms": (h.min or 0) / 1000,
+                    "p50_ms": h.percentile(50) / 1000,
+                    "p95_ms": h.percentile(95) / 1000,
+                    "p99_ms": h.percentile(99) / 1000,
+                    "max_ms": h.max / 1000,
+                }
+        return {"pid": os.getpid(), "uptime_s": time.time() - self.started, "stages": stages}
+
+    def dump(self, path):
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def start_periodic_dump(self, path, interval=10):
+        self.enabled = True
+
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    self.dump(path)
+                except OSError as e:
+                    print(f"Metrics dump failed: {e}")
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def serve(self, port, host='localhost'):
+        self.enabled = True
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') not in ('', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = json.dumps(metrics.snapshot(), indent=2).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+METRICS = Metrics()
+
+
+def add_metrics_arguments(parser):
+    parser.add_argument('--metrics-port', type=int, metavar='PORT',
+                        help='Serve per-stage latency histograms as JSON on localhost:PORT')
+    parser.add_argument('--metrics-file', metavar='PATH',
+                        help='Write per-stage latency histograms to PATH every 10 seconds')
+
+
+def configure_metrics(args):
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port)
+        print(f"Metrics at http://localhost:{args.metrics_port}/metrics")
+    if args.metrics_file:
+        METRICS.start_periodic_dump(args.metrics_file)
@@ -0,0 +1,113 @@
+import math
+
+SCORING_MODES = ("count", "tfidf", "bm25")
+# The key strings belong to the corpus. Per token a posting, per key its
+# doc id, length and the postings dicts of its rarer words; fitted over
+# short and long keys by benchmarks/bench_memory_overhead.py
+POSTING_OVERHEAD = 50
+KEY_OVERHEAD = 250
+
+
+class InvertedIndex:
+    def __init__(self, scoring="count", k1=1.2, b=0.75):
+        if scoring not in SCORING_MODES:
+            raise ValueError(f"Unknown scoring mode: {scoring}")
+        self.scoring = scoring
+        self.k1 = k1
+        self.b = b
+        self.postings = {}     # token -> {doc_id: term frequency}
+        self.doc_ids = {}      # key -> doc_id, in insertion order
+        self.keys = []         # doc_id -> key
+        self.doc_lengths = []
+        self.total_length = 0
+        self.source = None
+
+    def __len__(self):
+        self._ensure_built()
+        return len(self.keys)
+
+    def build(self, inputs_dict, lazy=False):
+        # Lazy building keeps startup constant for memory-mapped corpora; the
+        # postings are only filled in on the first lookup.
+        if lazy:
+            self.source = inputs_dict
+            return
+        for key in inputs_dict:
+            self.add(key)
+
+    def _ensure_built(self):
+        if self.source is not None:
+            source, self.source = self.source, None
+            for key in source:
+                self.add(key)
+
+    def add(self, key):
+        # Entries saved before the first lookup already sit in the source
+        if self.source is not None:
+            return None
+
+        # Keys never change their text, so re-saving an existing key keeps its
+        # doc id and with it the dict insertion order used for tie-breaking.
+        if key in self.doc_ids:
+            return self.doc_ids[key]
+
+        doc_id = len(self.keys)
+        self.doc_ids[key] = doc_id
+        self.keys.append(key)
+
+        tokens = key.split()
+        for token in tokens:
+            postings = self.postings.setdefault(token, {})
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+        self.doc_lengths.append(len(tokens))
+        self.total_length += len(tokens)
+        return doc_id
+
+    def memory_bytes(self):
+        # Nothing until the first lookup builds a lazy index
+        return self.total_length * POSTING_OVERHEAD + len(self.keys) * KEY_OVERHEAD
+
+    def _idf(self, df):
+        n = len(self.keys)
+        if self.scoring == "bm25":
+            return math.log(1 + (n - df + 0.5) / (df + 0.5))
+        return math.log(n / df) + 1
+
+    def score(self, words):
+        self._ensure_built()
+        scores = {}
+        avg_length = self.total_length / len(self.keys) if self.keys else 0
+
+        # Every occurrence of a query word counts, like the old linear scan
+        for word in words:
+            postings = self.postings.get(word)
+            if not postings:
+                continue
+
+            if self.scoring == "count":
+                for doc_id in postings:
+                    scores[doc_id] = scores.get(doc_id, 0) + 1
+                continue
+
+            idf = self._idf(len(postings))
+            for doc_id, tf in postings.items():
+                if self.scoring == "bm25":
+                    norm = 1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length
+                    weight = idf * tf * (self.k1 + 1) / (tf + self.k1 * norm)
+                else:
+                    weight = idf * tf
+                scores[doc_id] = scores.get(doc_id, 0) + weight
+        return scores
+
+    def search(self, words, limit=10):
+        scores = self.score(words)
+        # Earlier entries win ties, matching the strict '>' of the old scan
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(self.keys[doc_id], score) for doc_id, score in ranked[:limit]]
+
+    def best_match(self, words):
+        scores = self.score(words)
+        if not scores:
+            return None
+        doc_id = min(scores, key=lambda d: (-scores[d], d))
+        return self.keys[doc_id]
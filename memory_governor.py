@@ -0,0 +1,198 @@
+import gc
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from collections import Counter
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import ctypes
+    malloc_trim = ctypes.CDLL(None).malloc_trim  # glibc only
+except (ImportError, OSError, AttributeError, TypeError):
+    malloc_trim = None
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+
+
+def parse_size(text):
+    # "512M", "2G", "300000000"
+    text = text.strip().upper().rstrip('B').rstrip('I')
+    unit = text[-1:] if text[-1:] in UNITS else ''
+    return int(float(text[:len(text) - len(unit)]) * UNITS[unit])
+
+
+def current_rss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return 0
+    # Elsewhere only the peak is known: kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class MemoryGovernor:
+    # Keeps the process under an RSS budget. Structures register a function
+    # returning their approximate size in bytes and, if they can give memory
+    # back, one that drops a fraction of their contents and returns the bytes
+    # it freed, or None when it can't tell. Over budget, lower priorities are
+    # shrunk first, none by more than 'max_fraction' per check, until the
+    # freed bytes cover the excess. Structures whose shrinking narrows a
+    # setting, not just drops entries, also pass 'restore', called once RSS
+    # is back under budget.
+    def __init__(self, budget=None, interval=5.0, max_fraction=0.5):
+        self.budget = budget
+        self.interval = interval
+        self.max_fraction = max_fraction
+        self.structures = {}  # name -> (priority, size, shrink, restore)
+        self.lock = threading.Lock()
+        self.metrics = Counter()
+        self.freed = Counter()  # name -> bytes given back
+        self.ceiling = None  # what the shrinkable structures were left holding
+        self.thread = None
+
+    def register(self, name, size, shrink=None, priority=0, restore=None):
+        with self.lock:
+            self.structures[name] = (priority, size, shrink, restore)
+
+    def unregister(self, name):
+        with self.lock:
+            self.structures.pop(name, None)
+
+    def sizes(self):
+        with self.lock:
+            structures = list(self.structures.items())
+        return {name: size() for name, (_, size, _, _) in structures}
+
+    def _shrinkable(self):
+        with self.lock:
+            structures = sorted(self.structures.items(), key=lambda item: item[1][0])
+        return [(name, size, shrink) for name, (_, size, shrink, _) in structures
+                if shrink is not None]
+
+    def _restore(self):
+        with self.lock:
+            restores = [restore for _, _, _, restore in self.structures.values() if restore]
+        for restore in restores:
+            restore()
+        self.metrics["restored"] += 1
+
+    def check(self):
+        if not self.budget:
+            return 0
+        rss = current_rss()
+        if rss <= self.budget:
+            if self.ceiling is not None:
+                # Shrunk since the last time under budget
+                self.ceiling = None
+                self._restore()
+            return 0
+        self.metrics["over_budget"] += 1
+        structures = [(name, size(), shrink) for name, size, shrink in self._shrinkable()]
+        accounted = sum(current for _, current, _ in structures)
+        if self.ceiling is None:
+            # Down to 90%, so the next few turns don't cross the budget again
+            excess = rss - int(self.budget * 0.9)
+        else:
+            # What was freed last time often stays with the allocator to be
+            # reused, so RSS needn't drop; only growth since then is shed
+            excess = accounted - self.ceiling
+            if excess <= 0:
+                self.metrics["held"] += 1
+                return 0
+
+        freed = 0
+        measured = rss
+        for name, current, shrink in structures:
+            if current <= 0:
+                continue
+            released = shrink(min(self.max_fraction, (excess - freed) / current))
+            if released is None:
+                # Uncounted, like dropped mapped pages: RSS shows those at once
+                now = current_rss()
+                released, measured = max(0, measured - now), now
+            self.freed[name] += released
+            freed += released
+            if freed >= excess:
+                break
+        if freed < excess:
+            self.metrics["short"] += 1  # the rest is held by unregistered memory
+        self.ceiling = sum(size() for _, size, _ in self._shrinkable())
+
+        gc.collect()
+        if malloc_trim is not None:
+            malloc_trim(0)  # hands freed heap pages back, so RSS can drop
+        self.metrics["freed_bytes"] += freed
+        print(f"Memory: RSS {rss >> 20} MiB over the {self.budget >> 20} MiB budget, "
+              f"freed about {freed >> 20} MiB")
+        return freed
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.check()
+            except Exception as e:
+                print(f"Memory governor error: {e}")
+
+    def start(self):
+        if self.budget and self.thread is None:
+            self.thread = threading.Thread(target=self._watch, daemon=True)
+            self.thread.start()
+        return self
+
+    # ------------------- Deep dives -------------------
+    def trace(self, frames=1):
+        # tracemalloc slows every allocation down; only for finding a leak
+        tracemalloc.start(frames)
+
+    def top(self, limit=10):
+        if not tracemalloc.is_tracing():
+            return []
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)])
+        key = 'traceback' if tracemalloc.get_traceback_limit() > 1 else 'lineno'
+        return [(str(stat.traceback), stat.size, stat.count)
+                for stat in snapshot.statistics(key)[:limit]]
+
+    def stats(self):
+        stats = dict(self.metrics)
+        stats["rss_bytes"] = current_rss()
+        stats["budget_bytes"] = self.budget
+        stats["structures"] = self.sizes()
+        stats["freed"] = dict(self.freed)
+        if tracemalloc.is_tracing():
+            stats["traced_bytes"] = tracemalloc.get_traced_memory()[0]
+            stats["top"] = [f"{where}: {size} bytes in {count} blocks"
+                            for where, size, count in self.top()]
+        return stats
+
+
+GOVERNOR = MemoryGovernor()
+
+
+def add_memory_arguments(parser):
+    parser.add_argument('--memory-budget', type=parse_size, metavar='SIZE',
+                        help='Shed cached data when RSS goes over SIZE, e.g. 512M')
+    parser.add_argument('--memory-trace', type=int, default=0, metavar='FRAMES',
+                        help='Trace allocations with tracemalloc and list the largest sites '
+                             'in the memory stats; slow')
+
+
+def configure_memory(args):
+    if args.memory_trace:
+        GOVERNOR.trace(args.memory_trace)
+    if args.memory_budget:
+        GOVERNOR.budget = args.memory_budget
+        GOVERNOR.start()
+        print(f"Memory budget: {args.memory_budget >> 20} MiB RSS")
@@ -0,0 +1,54 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from html_stream import iter_bytes, iter_paragraphs, iter_response_paragraphs, response_encoding
+
+
+def parse_article(content, encoding, extract, word):
+    # Runs in a worker process: HTML parsing plus the caller's sentence filter
+    return extract(iter_paragraphs(iter_bytes(content), encoding), word)
+
+
+def _ready(_):
+    return os.getpid()
+
+
+class ParsePool:
+    # Fetcher threads only download; the CPU-bound parse runs in long-lived
+    # worker processes, so concurrent turns use every core instead of
+    # queueing on the GIL. 'extract' must be a module-level function
+    # (text_pipeline.extract_sentences, ...) so it pickles by reference.
+    def __init__(self, workers=None):
+        # One core stays with the event loop and fetch threads; on a single
+        # core the hand-off only adds latency, so parsing stays inline.
+        if workers is None:
+            workers = (os.cpu_count() or 1) - 1
+        self.workers = workers
+        self.executor = None
+
+    def start(self):
+        # Workers are forked on first use. Doing that at startup, before the
+        # fetch and prefetch threads exist, keeps their locks out of the children.
+        if self.workers > 0 and self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            list(self.executor.map(_ready, range(self.workers)))
+        return self
+
+    def parse(self, response, extract, word):
+        if self.executor is None:
+            # Inline mode keeps the streaming early exit of html_stream
+            return extract(iter_response_paragraphs(response), word)
+        content = response.content
+        try:
+            return self.executor.submit(parse_article, content, response_encoding(response),
+                                        extract, word).result()
+        except BrokenProcessPool:
+            print("Parse worker died; parsing in-thread from now on")
+            self.executor = None
+            return extract(iter_paragraphs(iter_bytes(content), response_encoding(response)), word)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
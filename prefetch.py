@@ -0,0 +1,109 @@
+import queue
+import threading
+import time
+from collections import Counter
+
+
+class PrefetchWorker:
+    # Warms the fetch cache for words we expect in the next incoming message.
+    # 'sources' is a list of (cache source name, fetch function) pairs; the
+    # fetch functions store their results in 'cache' themselves.
+    def __init__(self, cache, sources, max_queue=32, workers=2, keep_for=600):
+        self.cache = cache
+        self.sources = sources
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.keep_for = keep_for
+        self.generation = 0
+        self.warmed = {}    # word -> time its prefetch did a real round-trip
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.metrics = Counter()
+        self.threads = [threading.Thread(target=self._run, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def _drop_queued(self):
+        while True:
+            try:
+                _, word = self.queue.get_nowait()
+            except queue.Empty:
+                return
+            self.pending.discard(word)
+            self.metrics["cancelled_stale"] += 1
+            self.queue.task_done()
+
+    def predict(self, words):
+        # A new prediction makes everything still queued from older ones stale
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+            self._drop_queued()
+            words = [w for w in dict.fromkeys(words) if w and w not in self.pending]
+            self.pending.update(words)
+
+        for word in words:
+            try:
+                self.queue.put_nowait((generation, word))
+                self.metrics["queued"] += 1
+            except queue.Full:
+                with self.lock:
+                    self.pending.discard(word)
+                self.metrics["dropped_queue_full"] += 1
+
+    def cancel(self):
+        with self.lock:
+            self.generation += 1
+            self._drop_queued()
+
+    def _run(self):
+        while True:
+            generation, word = self.queue.get()
+            try:
+                if generation != self.generation:
+                    self.metrics["cancelled_stale"] += 1
+                    continue
+                self._prefetch(word)
+            finally:
+                with self.lock:
+                    self.pending.discard(word)
+                self.queue.task_done()
+
+    def _prefetch(self, word):
+        fetched = False
+        for source, fetch in self.sources:
+            if self.cache.contains(source, word):
+                continue
+            try:
+                fetch(word)
+                fetched = True
+            except Exception as e:
+                self.metrics["errors"] += 1
+                print(f"Prefetch of {word} failed: {e}")
+
+        if fetched:
+            self.metrics["prefetched"] += 1
+            with self.lock:
+                self.warmed[word] = time.monotonic()
+        else:
+            self.metrics["already_cached"] += 1
+
+    def consume(self, word):
+        # Called by the foreground fetch: counts whether the prefetch spared it
+        # a network round-trip.
+        with self.lock:
+            warmed_at = self.warmed.pop(word, None)
+            if len(self.warmed) > 4 * self.queue.maxsize:
+                cutoff = time.monotonic() - self.keep_for
+                for stale in [w for w, t in self.warmed.items() if t < cutoff]:
+                    del self.warmed[stale]
+        if warmed_at is not None and time.monotonic() - warmed_at <= self.keep_for:
+            self.metrics["saved_round_trips"] += 1
+            return True
+        self.metrics["not_predicted"] += 1
+        return False
+
+    def stats(self):
+        stats = dict(self.metrics)
+        looked_up = stats.get("saved_round_trips", 0) + stats.get("not_predicted", 0)
+        stats["hit_rate"] = stats.get("saved_round_trips", 0) / looked_up if looked_up else 0.0
+        return stats
@@ -0,0 +1,77 @@
+import os
+import time
+import signal
+import multiprocessing
+from multiprocessing.connection import wait
+
+# fork: workers start with the parent's imported modules and read-only
+# state already in place, and share its pages until they write to them
+CONTEXT = multiprocessing.get_context('fork')
+
+
+class Supervisor:
+    # Keeps 'workers' copies of target(number, *args) running. A worker that
+    # dies is replaced; one that keeps dying is restarted with growing delays.
+    def __init__(self, target, workers, args=(), max_backoff=30):
+        self.target = target
+        self.workers = workers
+        self.args = args
+        self.max_backoff = max_backoff
+        self.processes = {}   # slot -> Process
+        self.failures = {}    # slot -> (consecutive crashes, time of the last one)
+        self.stopping = False
+
+    def _start(self, slot):
+        process = CONTEXT.Process(target=self.target, args=(slot,) + tuple(self.args),
+                                  name=f"worker-{slot}", daemon=False)
+        process.start()
+        self.processes[slot] = process
+
+    def _stop(self, signum, frame):
+        self.stopping = True
+
+    def run(self, shutdown_grace=15):
+        previous = {sig: signal.signal(sig, self._stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            for slot in range(self.workers):
+                self._start(slot)
+            print(f"prefork: {self.workers} workers started")
+
+            while not self.stopping:
+                sentinels = {p.sentinel: slot for slot, p in self.processes.items()}
+                for sentinel in wait(list(sentinels), timeout=1):
+                    slot = sentinels[sentinel]
+                    process = self.processes[slot]
+                    process.join()
+                    if self.stopping:
+                        break
+                    self._restart(slot, process.exitcode)
+        finally:
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+            self.shutdown(shutdown_grace)
+
+    def _restart(self, slot, exitcode):
+        crashes, last = self.failures.get(slot, (0, 0))
+        now = time.monotonic()
+        crashes = crashes + 1 if now - last < 60 else 1
+        self.failures[slot] = (crashes, now)
+        delay = min(self.max_backoff, 0.5 * 2 ** (crashes - 1)) if crashes > 1 else 0
+        print(f"prefork: worker {slot} exited with {exitcode}; restarting"
+              + (f" in {delay:.1f}s" if delay else ""))
+        if delay:
+            time.sleep(delay)
+        if not self.stopping:
+            self._start(slot)
+
+    def shutdown(self, grace=15):
+        # Workers drain their connections on SIGTERM; stragglers get killed
+        for process in self.processes.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGTERM)
+        deadline = time.monotonic() + grace
+        for process in self.processes.values():
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.kill()
+                process.join()
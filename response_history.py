@@ -0,0 +1,166 @@
+import hashlib
+import threading
+from collections import deque
+from functools import lru_cache
+
+from text_pipeline import WORD
+
+DEFAULT_WINDOW = 1000
+DEFAULT_THRESHOLD = 3
+HASH_BITS = 64
+ENTRY_OVERHEAD = 800  # bench_memory_overhead.py: str header, deque entry, count, band buckets
+
+
+@lru_cache(maxsize=65536)
+def token_hash(token):
+    # Stable across runs, unlike hash()
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def simhash(tokens):
+    # Bag of words, so reshuffling the same sentences gives the same hash
+    weights = [0] * HASH_BITS
+    for token in tokens:
+        h = token_hash(token)
+        for bit in range(HASH_BITS):
+            weights[bit] += 1 if h >> bit & 1 else -1
+    value = 0
+    for bit, weight in enumerate(weights):
+        if weight > 0:
+            value |= 1 << bit
+    return value
+
+
+def parse_threshold(text):
+    # -1 turns near-duplicate matching off; a band needs at least one bit
+    threshold = int(text)
+    if not -1 <= threshold < HASH_BITS:
+        raise ValueError(f"threshold must be between -1 and {HASH_BITS - 1}")
+    return threshold
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class ResponseHistory:
+    # The last 'window' responses, with O(1) exact lookup and a SimHash index
+    # for near duplicates. Two texts count as the same when their hashes
+    # differ in at most 'threshold' bits; with threshold + 1 bands one band
+    # must then match exactly, so a lookup only compares a handful of entries.
+    def __init__(self, window=DEFAULT_WINDOW, threshold=DEFAULT_THRESHOLD, min_tokens=6):
+        if not -1 <= threshold < HASH_BITS:
+            raise ValueError(f"threshold must be between -1 and {HASH_BITS - 1}")
+        self.window = window
+        self.configured_window = window  # shrink() narrows 'window' only for a while
+        self.threshold = threshold
+        self.min_tokens = min_tokens
+        # Below zero only exact repeats count: nothing is fingerprinted or banded
+        self.bands = max(threshold + 1, 0)
+        self.band_bits = HASH_BITS // self.bands if self.bands else 0
+        self.entries = deque()     # (sequence number, text, simhash or None)
+        self.counts = {}           # text -> entries holding it
+        self.index = {}            # (band, band value) -> {sequence number: simhash}
+        self.sequence = 0
+        self.text_bytes = 0
+        # The memory governor trims from its own thread
+        self.lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _fingerprint(self, text):
+        tokens = WORD.findall(text.lower())
+        # Too few tokens make the hash too noisy to call anything similar
+        if self.threshold < 0 or len(tokens) < self.min_tokens:
+            return None
+        return simhash(tokens)
+
+    def _band_keys(self, value):
+        mask = (1 << self.band_bits) - 1
+        return [(band, value >> (band * self.band_bits) & mask) for band in range(self.bands)]
+
+    def _near(self, value):
+        for key in self._band_keys(value):
+            for other in self.index.get(key, {}).values():
+                if hamming(value, other) <= self.threshold:
+                    return True
+        return False
+
+    def __contains__(self, text):
+        value = self._fingerprint(text)
+        with self.lock:
+            if text in self.counts:
+                self.exact_hits += 1
+                return True
+            if value is not None and self._near(value):
+                self.near_hits += 1
+                return True
+        return False
+
+    def add(self, text):
+        value = self._fingerprint(text)
+        with self.lock:
+            self.sequence += 1
+            self.entries.append((self.sequence, text, value))
+            self.text_bytes += len(text)
+            self.counts[text] = self.counts.get(text, 0) + 1
+            if value is not None:
+                for key in self._band_keys(value):
+                    self.index.setdefault(key, {})[self.sequence] = value
+
+            while len(self.entries) > self.window:
+                self._evict()
+
+    # deque-style name, so it drops in for the old lists
+    append = add
+
+    def _evict(self):
+        sequence, text, value = self.entries.popleft()
+        self.text_bytes -= len(text)
+        if self.counts[text] == 1:
+            del self.counts[text]
+        else:
+            self.counts[text] -= 1
+        if value is not None:
+            for key in self._band_keys(value):
+                bucket = self.index[key]
+                del bucket[sequence]
+                if not bucket:
+                    del self.index[key]
+
+    def add_if_new(self, text):
+        if text in self:
+            return False
+        self.add(text)
+        return True
+
+    def memory_bytes(self):
+        with self.lock:
+            return self.text_bytes + len(self.entries) * ENTRY_OVERHEAD
+
+    def shrink(self, fraction):
+        # Narrows the window and drops the oldest responses now, so an idle
+        # conversation gives its memory back too. Repeats further back than
+        # the new window are no longer caught.
+        with self.lock:
+            keep = max(1, len(self.entries) - int(len(self.entries) * fraction))
+            if keep >= len(self.entries):
+                return 0
+            before = self.text_bytes + len(self.entries) * ENTRY_OVERHEAD
+            self.window = min(self.window, keep)
+            while len(self.entries) > self.window:
+                self._evict()
+            return before - self.text_bytes - len(self.entries) * ENTRY_OVERHEAD
+
+    def restore(self):
+        # Back under budget: the window refills to its configured length
+        with self.lock:
+            self.window = self.configured_window
+
+    def stats(self):
+        return {"size": len(self.entries), "window": self.window,
+                "configured_window": self.configured_window, "threshold": self.threshold,
+                "exact_hits": self.exact_hits, "near_hits": self.near_hits}
@@ -0,0 +1,178 @@
+import heapq
+import math
+import threading
+from collections import Counter, OrderedDict
+from functools import lru_cache
+
+from text_pipeline import WORD, STOPWORDS, clean_sentence, score_sentence, split_sentences
+
+DEFAULT_MAX_SENTENCES = 200000
+# Not indexed: on top of STOPWORDS, words in so many sentences that sharing
+# them says nothing about what two sentences are about
+FUNCTION_WORDS = {
+    "and", "but", "for", "nor", "yet", "was", "were", "are", "has", "have", "had", "been",
+    "being", "with", "from", "into", "onto", "over", "under", "than", "then", "that", "this",
+    "these", "those", "there", "their", "they", "them", "its", "his", "her", "hers", "him",
+    "she", "you", "your", "our", "who", "whom", "whose", "which", "what", "when", "where",
+    "while", "also", "not", "can", "could", "would", "should", "will", "may", "might",
+    "such", "some", "any", "all", "each", "more", "most", "other", "only", "very", "one",
+    "between", "after", "before", "during",
+}
+# Heap per sentence beyond its characters, from bench_memory_overhead.py:
+# about 1900 bytes in a 2k-sentence store, 1200 at 100k, as posting sets
+# fill up
+SENTENCE_OVERHEAD = 1500
+
+
+@lru_cache(maxsize=65536)
+def normalize_keyword(word):
+    # Folds plain plurals, so "volcanoes" and "islands" find the sentences
+    # filed under "volcano" and "island"
+    word = word.lower().strip('.,;:!?"\'()')
+    if len(word) <= 3:
+        return word
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('es') and word[:-2].endswith(('s', 'x', 'z', 'ch', 'sh', 'o')):
+        return word[:-2]
+    if word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def sentence_terms(sentence):
+    return {normalize_keyword(w) for w in set(WORD.findall(sentence.lower()))
+            if w not in STOPWORDS and w not in FUNCTION_WORDS and len(w) > 2}
+
+
+class SentenceStore:
+    # Every sentence of every fetched article, kept once, with a posting list
+    # of sentence ids per normalized keyword. A turn whose keywords all have
+    # postings is answered by intersecting them instead of refetching the
+    # articles. Least recently used sentences go once 'max_sentences' is hit.
+    def __init__(self, max_sentences=DEFAULT_MAX_SENTENCES, min_postings=3,
+                 common_fraction=0.02, min_common=500):
+        self.max_sentences = max_sentences
+        # A word seen in a sentence or two of another article still needs its own
+        self.min_postings = min_postings
+        # Words in this many sentences say little about what one is about;
+        # searching skips them while the query has rarer ones
+        self.common_fraction = common_fraction
+        self.min_common = min_common
+        self.sentences = OrderedDict()   # id -> sentence, least recently used first
+        self.ids = {}                    # sentence -> id
+        self.postings = {}               # term -> set of ids
+        self.next_id = 0
+        self.text_bytes = 0
+        self.lock = threading.Lock()
+        self.metrics = Counter()
+
+    def add(self, paragraphs):
+        # Tokenized before taking the lock; turns searching meanwhile don't wait
+        sentences = []
+        for paragraph in paragraphs:
+            for sentence in split_sentences(paragraph):
+                sentence = clean_sentence(sentence)
+                if sentence.endswith('.') and sentence.count(' ') >= 4 and sentence not in self.ids:
+                    sentences.append((sentence, sentence_terms(sentence)))
+
+        added = 0
+        with self.lock:
+            for sentence, terms in sentences:
+                if sentence in self.ids:
+                    self.metrics["duplicates"] += 1
+                    continue
+                sentence_id = self.next_id
+                self.next_id += 1
+                self.sentences[sentence_id] = sentence
+                self.ids[sentence] = sentence_id
+                self.text_bytes += len(sentence)
+                for term in terms:
+                    self.postings.setdefault(term, set()).add(sentence_id)
+                added += 1
+            if len(self.sentences) > self.max_sentences:
+                self._evict(len(self.sentences) - int(self.max_sentences * 0.9))
+            self.metrics["added"] += added
+        return added
+
+    def _evict(self, count):
+        for _ in range(count):
+            sentence_id, sentence = self.sentences.popitem(last=False)
+            del self.ids[sentence]
+            self.text_bytes -= len(sentence)
+            for term in sentence_terms(sentence):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.discard(sentence_id)
+                    if not postings:
+                        del self.postings[term]
+        self.metrics["evicted"] += count
+
+    def missing(self, keywords):
+        # The words a turn still has to fetch; stopwords never get postings.
+        # Function words aren't indexed either, but their articles are no use.
+        with self.lock:
+            return [word for word in keywords
+                    if normalize_keyword(word) not in FUNCTION_WORDS
+                    and len(self.postings.get(normalize_keyword(word), ())) < self.min_postings]
+
+    def search(self, keywords, limit=10):
+        # (score, sentence) pairs, best first, scored per keyword like fetched
+        # sentences. Candidates are the sentences sharing the most rare
+        # keywords, weighted by how rare each one is.
+        keywords = [word for word in keywords if sentence_terms(word)]
+        terms = list(dict.fromkeys(normalize_keyword(word) for word in keywords))
+        with self.lock:
+            common = max(self.min_common, len(self.sentences) * self.common_fraction)
+            known = [self.postings[t] for t in terms if t in self.postings]
+            # Common words only narrow nothing down next to rarer ones; a
+            # query made of nothing else is still answered from them
+            lists = sorted([p for p in known if len(p) <= common] or known, key=len)
+            if not lists:
+                self.metrics["misses"] += 1
+                return []
+            matched = lists[0].intersection(*lists[1:])
+            if len(matched) >= limit or len(lists) == 1:
+                candidates = [(len(lists), sentence_id) for sentence_id in matched]
+                full = len(lists) > 1
+            else:
+                weights = Counter()
+                for postings in lists:
+                    weight = math.log(1 + len(self.sentences) / len(postings))
+                    for sentence_id in postings:
+                        weights[sentence_id] += weight
+                candidates = [(weight, sentence_id) for sentence_id, weight in weights.items()]
+                full = False
+            # Only the best few are scored, newest first among equal weights
+            candidates = heapq.nlargest(limit * 4, candidates)
+            found = []
+            for weight, sentence_id in candidates:
+                self.sentences.move_to_end(sentence_id)
+                found.append((weight, self.sentences[sentence_id]))
+            self.metrics["full_matches" if full else "hits"] += 1
+
+        scored = [(max(score_sentence(sentence, word) for word in keywords), weight, sentence)
+                  for weight, sentence in found]
+        scored.sort(key=lambda item: (-item[0], -item[1]))
+        return [(score, sentence) for score, _, sentence in scored[:limit]]
+
+    def memory_bytes(self):
+        with self.lock:
+            return self.text_bytes + len(self.sentences) * SENTENCE_OVERHEAD
+
+    def shrink(self, fraction):
+        # Drops the least recently used 'fraction' of the sentences
+        with self.lock:
+            before = self.text_bytes + len(self.sentences) * SENTENCE_OVERHEAD
+            count = int(len(self.sentences) * fraction)
+            if count:
+                self._evict(count)
+            return before - self.text_bytes - len(self.sentences) * SENTENCE_OVERHEAD
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+            stats["sentences"] = len(self.sentences)
+            stats["terms"] = len(self.postings)
+            stats["text_bytes"] = self.text_bytes
+        return stats
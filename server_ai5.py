@@ -1,20 +1,58 @@
 import socket
+import asyncio
+import signal
 import random
 import time
 import json
 import re
-import requests
 import os
 import argparse
-from bs4 import BeautifulSoup
+import weakref
+from collections.abc import Sequence
 from concurrent.futures import ThreadPoolExecutor
 import colorama
 from colorama import Fore, Style
-import shutil
-import subprocess  # For running shell commands
+import threading
+from inverted_index import InvertedIndex, SCORING_MODES
+from corpus_log import CorpusLog, run_writer
+from corpus_snapshot import BACKUP_DIR, SnapshotScheduler
+from corpus_mmap import CorpusDict, memory_bytes, release_pages
+from fetch_cache import FetchCache, MISS
+from http_pool import HttpClient
+from parse_pool import ParsePool
+from text_pipeline import article_paragraphs, clean_response, content_words, extract_sentences
+from prefetch import PrefetchWorker
+from source_race import SourceRacer
+from sentence_store import SentenceStore, DEFAULT_MAX_SENTENCES
+from answer_cache import AnswerCache, DEFAULT_ENTRIES, DEFAULT_TTL
+from codegen_client import run_console
+from prefork import CONTEXT, Supervisor
+from wiki_dump import WikiIndex
+from response_history import ResponseHistory, DEFAULT_WINDOW, DEFAULT_THRESHOLD, parse_threshold
+from instrumentation import METRICS, add_metrics_arguments, configure_metrics
+from memory_governor import GOVERNOR, add_memory_arguments, configure_memory
+from framing import (CHUNK, END, ERROR, FrameReader, ProtocolError, encode_frame, send_message,
+                     read_message_async)
 
 # Original configuration
-cache = {}
+cache = FetchCache()  # shared on disk with client_ai4.py
+http_client = HttpClient.from_env()
+wiki_index = WikiIndex.open_existing()  # built by wiki_dump.py for offline lookups
+parse_pool = ParsePool(0)  # parses in the fetching thread until main starts the workers
+racer = SourceRacer(ThreadPoolExecutor(max_workers=8), budget=3.0)  # per-turn fetch deadline
+input_index = InvertedIndex()
+sentence_store = SentenceStore()  # every fetched sentence, for multi-keyword answers
+corpus_log = CorpusLog()
+corpus_lock = threading.RLock()  # async mode saves and matches from many threads
+snapshots = SnapshotScheduler()  # incremental corpus backups in BACKUP_DIR
+prefetcher = None  # PrefetchWorker when started with --prefetch
+corpus_writer = None  # queue to the single writer process in prefork mode
+history_window = DEFAULT_WINDOW  # responses remembered per conversation
+history_threshold = DEFAULT_THRESHOLD  # SimHash bits two near duplicates may differ in
+stream_responses = False  # send each answer sentence by sentence with --stream
+histories = weakref.WeakSet()  # every open conversation's ResponseHistory
+FALLBACK_FEEDBACK = "Could you please rephrase or provide more context?"
+answer_cache = AnswerCache(keep=lambda answer: answer != FALLBACK_FEEDBACK)  # whole answers by question
 WHITE = "\033[97m"
 RED = "\033[91m"
 GREEN = "\033[92m"
@@ -50,67 +88,135 @@ def autocorrect_json(file_path):
         file.write(corrected_content)
     print(f"Corrected JSON in {file_path}.")
 
-def load_responses():
+def import_legacy_json():
+    # First run after the switch to the corpus log: import the old JSON files
     autocorrect_json('inputs.json')
     autocorrect_json('responses.json')
 
     try:
         with open('inputs.json', 'r') as f:
-            inputs = json.load(f)
+            inputs = CorpusDict(json.load(f)['input'])
     except FileNotFoundError:
-        inputs = {"input": {}}
-    
+        inputs = CorpusDict()
+
     try:
         with open('responses.json', 'r') as f:
-            responses = json.load(f)
+            responses = CorpusDict(json.load(f)['input'])
     except FileNotFoundError:
-        responses = {"input": {}}
+        responses = CorpusDict()
 
-    return inputs['input'], responses['input']
+    if inputs or responses:
+        corpus_log.write_snapshot(inputs, responses)
+    return inputs, responses
+
+def load_responses():
+    if corpus_log.exists():
+        inputs, responses = corpus_log.load()
+    else:
+        inputs, responses = import_legacy_json()
+
+    input_index.build(inputs, lazy=True)
+    register_memory(inputs, responses)
+    return inputs, responses
+
+def register_memory(inputs_dict, responses_dict):
+    # Shed first what is cheapest to get back: pages the kernel rereads,
+    # then whole answers, then sentences that would have to be fetched
+    # again. Shorter repeat-suppression windows come last.
+    GOVERNOR.register('corpus', lambda: memory_bytes(inputs_dict, responses_dict),
+                      lambda fraction: release_pages(inputs_dict, responses_dict))
+    GOVERNOR.register('input_index', lambda: input_index.memory_bytes())
+    GOVERNOR.register('fetch_cache', lambda: cache.memory_bytes(),
+                      lambda fraction: cache.shrink(fraction))
+    if answer_cache:
+        GOVERNOR.register('answer_cache', answer_cache.memory_bytes, answer_cache.shrink, priority=1)
+    if sentence_store:
+        GOVERNOR.register('sentence_store', sentence_store.memory_bytes, sentence_store.shrink,
+                          priority=2)
+    GOVERNOR.register('histories', lambda: sum(h.memory_bytes() for h in list(histories)),
+                      lambda fraction: sum(h.shrink(fraction) for h in list(histories)), priority=3,
+                      restore=lambda: [h.restore() for h in list(histories)])
+
+def new_history():
+    history = ResponseHistory(history_window, history_threshold)
+    histories.add(history)
+    return history
 
 # The rest of your existing code follows...
 
 def save_input_response(inputs_dict, responses_dict, input_message, response_message):
-    inputs_dict[input_message] = {"meaning": response_message}
-    with open('inputs.json', 'w') as f:
-        json.dump({"input": inputs_dict}, f, ensure_ascii=False, indent=4)
-
-    responses_dict[response_message] = {"meaning": response_message}
-    with open('responses.json', 'w') as f:
-        json.dump({"input": responses_dict}, f, ensure_ascii=False, indent=4)
+    with METRICS.span('save'), corpus_lock:
+        inputs_dict[input_message] = {"meaning": response_message}
+        input_index.add(input_message)
+        responses_dict[response_message] = {"meaning": response_message}
+
+        # One checksummed log record per turn instead of rewriting both JSON files
+        record = ([input_message, inputs_dict[input_message]],
+                  [response_message, responses_dict[response_message]])
+        if corpus_writer is not None:
+            corpus_writer.put(record)
+        else:
+            corpus_log.append(*record)
+
+def apply_record(record, inputs_dict, responses_dict):
+    # A pair another prefork worker learned, read back from the corpus log
+    with corpus_lock:
+        if record.get("inputs"):
+            key, value = record["inputs"]
+            inputs_dict[key] = value
+            input_index.add(key)
+        if record.get("responses"):
+            key, value = record["responses"]
+            responses_dict[key] = value
 
 def find_random_starting_response(responses_dict):
     if responses_dict:
-        return random.choice(list(responses_dict.values()))['meaning']
+        values = responses_dict.values()
+        if not isinstance(values, Sequence):
+            values = list(values)
+        return random.choice(values)['meaning']
     return "Hello, how can I assist you?"
 
-def clean_response(response):
-    return re.sub(r'\s*[\d+]', '', response).strip()
-
+@METRICS.timed('fetch', source='wikipedia')
 def fetch_wikipedia_sentences(word):
-    if word in cache:
-        return cache[word]
+    # The article and the filter only depend on the lowercased word
+    key = word.lower()
+    if wiki_index:
+        paragraphs = wiki_index.lookup(key)
+        if paragraphs is not None:
+            METRICS.tag(cache='dump')
+            if sentence_store:
+                sentence_store.add(paragraphs)
+            return extract_sentences(paragraphs, word)
+
+    cached = cache.get('wikipedia_sentences', key)
+    METRICS.tag(cache='miss' if cached is MISS else 'hit')
+    if cached is not MISS:
+        if sentence_store:
+            sentence_store.add(cached)  # after a restart the store starts out empty
+        return cached
 
     url = f"https://en.wikipedia.org/wiki/{word.capitalize()}"
-    response = requests.get(url)
+    response = http_client.get(url, stream=True)
     
-    if response.status_code == 200:
-        if '(disambiguation)' in response.url:
-            cache[word] = []
-            return []
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        paragraphs = soup.find_all('p')
-        sentences = []
-        for paragraph in paragraphs:
-            sentences.extend(re.split(r'(?<=[.!?]) +', paragraph.text))
-        
-        filtered_sentences = [clean_response(sentence) for sentence in sentences if word.lower() in sentence.lower()]
-        
-        filtered_sentences = [s for s in filtered_sentences if s.endswith('.') and not s.endswith(':')]
-        cache[word] = filtered_sentences[:5]
-        return cache[word]
-    return []
+    try:
+        if response.status_code == 200:
+            if '(disambiguation)' in response.url:
+                return cache.put_negative('wikipedia_sentences', key, [])
+
+            with METRICS.span('extract', source='wikipedia'):
+                if sentence_store:
+                    paragraphs = parse_pool.parse(response, article_paragraphs, word)
+                    sentence_store.add(paragraphs)
+                    sentences = extract_sentences(paragraphs, word)
+                else:
+                    sentences = parse_pool.parse(response, extract_sentences, word)
+            return cache.put('wikipedia_sentences', key, sentences)
+        if response.status_code == 404:
+            return cache.put_negative('wikipedia_sentences', key, [])
+        return []
+    finally:
+        response.close()
 
 def format_sentence(sentence):
     if '[' in sentence or ']' in sentence:
@@ -119,52 +225,71 @@ def format_sentence(sentence):
     if sentence and sentence.endswith('.') and not sentence.endswith(':'):
         return sentence[0].upper() + sentence[1:]
 
+@METRICS.timed('fetch', source='duckduckgo')
+def fetch_ddg_abstract(query):
+    cached = cache.get('ddg_abstract', query)
+    METRICS.tag(cache='miss' if cached is MISS else 'hit')
+    if cached is not MISS:
+        return cached
+
+    response = http_client.get(
+        f"https://api.duckduckgo.com/?q={query.replace(' ', '+')}&format=json&no_html=1",
+        timeout=3
+    )
+    if response.status_code != 200:
+        return None
+    abstract = response.json().get('AbstractText')
+    if abstract:
+        return cache.put('ddg_abstract', query, abstract)
+    return cache.put_negative('ddg_abstract', query)
+
+@METRICS.timed('fetch', source='wikidata')
+def fetch_wikidata_description(query):
+    cached = cache.get('wikidata_description', query)
+    METRICS.tag(cache='miss' if cached is MISS else 'hit')
+    if cached is not MISS:
+        return cached
+
+    response = http_client.get(
+        f"https://www.wikidata.org/w/api.php?action=wbsearchentities&search={query.replace(' ', '+')}&format=json&language=en",
+        timeout=3
+    )
+    if response.status_code != 200:
+        return None
+    search = response.json().get('search')
+    if search:
+        return cache.put('wikidata_description', query, search[0].get('description'))
+    return cache.put_negative('wikidata_description', query)
+
 def enhanced_response_generation(input_words):
-    try:
-        ddg_response = requests.get(
-            f"https://api.duckduckgo.com/?q={'+'.join(input_words)}&format=json&no_html=1",
-            timeout=3
-        )
-        if ddg_response.status_code == 200:
-            data = ddg_response.json()
-            if data.get('AbstractText'):
-                return data['AbstractText']
-        
-        wd_response = requests.get(
-            f"https://www.wikidata.org/w/api.php?action=wbsearchentities&search={'+'.join(input_words)}&format=json&language=en",
-            timeout=3
-        )
-        if wd_response.status_code == 200:
-            data = wd_response.json()
-            if data.get('search'):
-                return data['search'][0].get('description')
-    except:
-        pass
-    return None
+    # Both sources start at once; DuckDuckGo's abstract still wins when it
+    # arrives within the budget, Wikidata's description is the fallback.
+    answers = {}
 
-def best_match_response(user_input, inputs_dict):
-    max_match_count = 0
-    best_response = None
+    def on_result(number, source, query, answer):
+        answers[source] = answer or None
 
-    normalized_input = user_input.strip().lower().split()
+    def good_enough():
+        return bool(answers.get('duckduckgo')) or len(answers) == 2
 
-    for key in inputs_dict.keys():
-        current_response = inputs_dict[key]["meaning"]
-        key_words = key.split()
-        
-        match_count = sum(1 for word in normalized_input if word in key_words)
-        
-        if match_count > max_match_count:
-            max_match_count = match_count
-            best_response = current_response
+    query = ' '.join(input_words)
+    racer.race([('duckduckgo', fetch_ddg_abstract, query), ('wikidata', fetch_wikidata_description, query)],
+               on_result, good_enough)
+    return answers.get('duckduckgo') or answers.get('wikidata')
+
+def best_match_response(user_input, inputs_dict):
+    normalized_input = user_input.strip().lower().split()
 
-    return best_response
+    # Only the postings for the input's words are touched, not every key
+    with METRICS.span('best_match'), corpus_lock:
+        best_key = input_index.best_match(normalized_input)
+        if best_key is None:
+            return None
+        return inputs_dict[best_key]["meaning"]
 
-def create_backup():
-    if not os.path.exists("killme"):
-        os.makedirs("killme")
-    shutil.copy("server_ai2.py", "killme/server_ai2.py")
-    shutil.copy("client_ai2.py", "killme/client_ai2.py")
+def create_backup(force=False):
+    # Snapshots the learned corpus from a separate process; returns at once
+    return snapshots.request(force)
 
 def list_functions():
     with open(__file__, 'r') as f:
@@ -189,6 +314,149 @@ def show_function_code(function_name):
 
     return ''.join(function_code)
 
+def handle_command(response):
+    if response.lower() == "run programming console":
+        print("Running programming console...")
+        run_console()
+        return True
+    
+    if response.lower() == "backup":
+        if create_backup(force=True):
+            print(f"Backing up the corpus to the '{BACKUP_DIR}' folder.")
+        else:
+            print("A backup is already running.")
+        return True
+    
+    if response.lower() == "memory":
+        print(f"Memory: {GOVERNOR.stats()}")
+        return True
+    
+    if response.lower() == "show functions":
+        functions = list_functions()
+        print("Available functions:")
+        for i, func in enumerate(functions, 1):
+            print(f"{i}. {func}")
+        
+        selected = int(input("Select a function to show: ")) - 1
+        if 0 <= selected < len(functions):
+            function_code = show_function_code(functions[selected])
+            print(f"Code for {functions[selected]}:\n{function_code}")
+        return True
+    return False
+
+def predict_keywords(feedback):
+    # The client replies with sentences about the keywords of what we send,
+    # and we look up every word of that reply next.
+    return content_words(feedback)[:8]
+
+def fetch_all_sentences(input_words, executor, on_sentences=None):
+    # Words whose article misses the budget are left out of this turn; their
+    # fetch finishes in the background and is cached for the next one.
+    results = {}
+
+    def on_result(number, source, word, sentences):
+        results[number] = sentences
+        if on_sentences and sentences:
+            on_sentences(sentences)
+
+    racer.race([('wikipedia', fetch_wikipedia_sentences, word) for word in input_words],
+               on_result, executor=executor)
+    return [results[number] for number in sorted(results)]
+
+def build_feedback(response, inputs_dict, conversation_history, executor, on_chunk=None):
+    # With on_chunk the answer is also handed over in parts, joined they are
+    # the returned feedback. The first is the first usable sentence to arrive;
+    # the rest of the answer is picked around it once the fetches are done.
+    started = time.perf_counter_ns()
+    input_words = fetch_words = response.split()
+    all_relevant_sentences = []
+    first = []
+
+    def offer(sentences):
+        if on_chunk is None or first:
+            return
+        for sentence in sentences:
+            formatted = format_sentence(sentence)
+            if formatted and formatted not in conversation_history:
+                first.append(formatted)
+                METRICS.record('first_chunk', None, time.perf_counter_ns() - started)
+                on_chunk(formatted)
+                return
+
+    if prefetcher:
+        # Only words predict_keywords could have named count as missed
+        for word in dict.fromkeys(content_words(response)):
+            prefetcher.consume(word)
+
+    # Words the store already knows are answered from it, all at once, so
+    # sentences naming several of them come first; only the rest are fetched
+    if sentence_store:
+        with METRICS.span('local'):
+            all_relevant_sentences.extend(s for _, s in sentence_store.search(content_words(response)))
+            fetch_words = sentence_store.missing(input_words)
+        offer(all_relevant_sentences)
+
+    with METRICS.span('fetch_all'):
+        results = fetch_all_sentences(fetch_words, executor, offer)
+
+    for sentences in results:
+        all_relevant_sentences.extend(sentences)
+
+    with METRICS.span('format'):
+        formatted_sentences = [format_sentence(sentence) for sentence in all_relevant_sentences]
+        formatted_sentences = [s for s in formatted_sentences if s]
+
+    feedback = FALLBACK_FEEDBACK
+    
+    if formatted_sentences:
+        max_attempts = 3
+        # A sentence already streamed has to stay the answer's first
+        rest = [s for s in formatted_sentences if s not in first]
+        for _ in range(max_attempts):
+            max_sentences = random.randint(1, 5)
+            selected = first + random.sample(
+                rest,
+                max(0, min(max_sentences - len(first), len(rest)))
+            )
+            candidate = ' '.join(selected)
+            if candidate not in conversation_history:
+                feedback = candidate
+                conversation_history.append(feedback)
+                break
+        else:
+            enhanced = enhanced_response_generation(input_words)
+            selected = first + [enhanced] if enhanced else first
+            if first:
+                feedback = ' '.join(selected)
+                conversation_history.append(feedback)
+            else:
+                feedback = enhanced if enhanced else feedback
+        if first:
+            for chunk in selected[1:]:
+                on_chunk(chunk)
+            return feedback
+    else:
+        enhanced = enhanced_response_generation(input_words)
+        if enhanced:
+            feedback = enhanced
+        else:
+            best_match = best_match_response(response, inputs_dict)
+            feedback = best_match if best_match else feedback
+    if on_chunk:
+        on_chunk(feedback)
+    return feedback
+
+def answer_turn(response, inputs_dict, conversation_history, executor, on_chunk=None):
+    # A repeated question, or the same keywords reworded, skips the fetches
+    # unless this conversation has already been given every cached answer;
+    # a cached answer is never streamed, it is ready all at once
+    def compute():
+        return build_feedback(response, inputs_dict, conversation_history, executor, on_chunk)
+
+    if answer_cache is None:
+        return compute()
+    return answer_cache.get_or_compute(response, compute, accept=conversation_history.add_if_new)
+
 def start_server():
     inputs_dict, responses_dict = load_responses()
     server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -199,82 +467,47 @@ def start_server():
     conn, addr = server.accept()
     print(f"server_ai2.py: Connected to {addr}")
 
-    conversation_history = []
+    conversation_history = new_history()
 
     message = find_random_starting_response(responses_dict)
-    conn.sendall(clean_response(message).encode('utf-8'))
-    time.sleep(0.001)
+    send_message(conn, clean_response(message))
 
+    reader = FrameReader(conn)
     response_count = 0
 
     with ThreadPoolExecutor(max_workers=10) as executor:
         while True:
             try:
-                response = conn.recv(1024).decode('utf-8')
+                # Frames already queued by a pipelining client are served in order
+                with METRICS.span('receive'):
+                    response = reader.read_message()
+                if response is None:
+                    print("server_ai2.py: Client disconnected")
+                    break
                 response = clean_response(response)
                 print(f"{Fore.RED}[{Fore.RESET}>{Fore.RED}]: {GREEN}{response}")
 
-                if response.lower() == "run programming console":
-                    print("Running programming console...")
-                    subprocess.run(["sudo", "bash", "use_coder.sh"], check=True)
-                    continue
-                
-                if response.lower() == "backup":
-                    create_backup()
-                    print("Backup created in 'killme' folder.")
-                    continue
-                
-                if response.lower() == "show functions":
-                    functions = list_functions()
-                    print("Available functions:")
-                    for i, func in enumerate(functions, 1):
-                        print(f"{i}. {func}")
-                    
-                    selected = int(input("Select a function to show: ")) - 1
-                    if 0 <= selected < len(functions):
-                        function_code = show_function_code(functions[selected])
-                        print(f"Code for {functions[selected]}:\n{function_code}")
+                if handle_command(response):
                     continue
 
-                input_words = response.split()
-                all_relevant_sentences = []
-
-                results = list(executor.map(fetch_wikipedia_sentences, input_words))
-
-                for sentences in results:
-                    all_relevant_sentences.extend(sentences)
-
-                formatted_sentences = [format_sentence(sentence) for sentence in all_relevant_sentences]
-                formatted_sentences = [s for s in formatted_sentences if s]
-
-                feedback = "Could you please rephrase or provide more context?"
-                
-                if formatted_sentences:
-                    max_attempts = 3
-                    for _ in range(max_attempts):
-                        max_sentences = random.randint(1, 5)
-                        selected = random.sample(
-                            formatted_sentences,
-                            min(max_sentences, len(formatted_sentences))
-                        )
-                        candidate = ' '.join(selected)
-                        if candidate not in conversation_history:
-                            feedback = candidate
-                            conversation_history.append(feedback)
-                            break
-                    else:
-                        enhanced = enhanced_response_generation(input_words)
-                        feedback = enhanced if enhanced else feedback
-                else:
-                    enhanced = enhanced_response_generation(input_words)
-                    if enhanced:
-                        feedback = enhanced
-                    else:
-                        best_match = best_match_response(response, inputs_dict)
-                        feedback = best_match if best_match else feedback
+                with METRICS.span('turn'):
+                    streamed = []
 
-                save_input_response(inputs_dict, responses_dict, response, feedback)
-                conn.sendall(clean_response(feedback).encode('utf-8'))
+                    def send_chunk(text):
+                        streamed.append(text)
+                        send_message(conn, clean_response(text), CHUNK)
+
+                    feedback = answer_turn(response, inputs_dict, conversation_history, executor,
+                                           send_chunk if stream_responses else None)
+
+                    save_input_response(inputs_dict, responses_dict, response, feedback)
+                    if prefetcher:
+                        prefetcher.predict(predict_keywords(feedback))
+                    with METRICS.span('send'):
+                        if streamed:
+                            send_message(conn, '', END)
+                        else:
+                            send_message(conn, clean_response(feedback))
 
                 response_count += 1
                 if response_count % 10 == 0:
@@ -284,14 +517,250 @@ def start_server():
                     break
             except Exception as e:
                 print(f"Error: {e}")
+                try:
+                    send_message(conn, f"Server error: {type(e).__name__}", ERROR)
+                except OSError:
+                    pass
                 break
 
     conn.close()
     server.close()
+    if prefetcher:
+        print(f"Prefetch: {prefetcher.stats()}")
+    if sentence_store:
+        print(f"Sentence store: {sentence_store.stats()}")
+    if answer_cache:
+        print(f"Answer cache: {answer_cache.stats()}")
+    print(f"Memory: {GOVERNOR.stats()}")
+
+# ------------------- Asyncio Server -------------------
+def raise_open_file_limit():
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def run_turn(response, inputs_dict, responses_dict, conversation_history, executor, on_chunk=None):
+    if handle_command(response):
+        return None
+    with METRICS.span('turn'):
+        feedback = answer_turn(response, inputs_dict, conversation_history, executor, on_chunk)
+        save_input_response(inputs_dict, responses_dict, response, feedback)
+    return feedback
+
+async def serve_connection(reader, writer, inputs_dict, responses_dict,
+                           turn_executor, fetch_executor, read_timeout):
+    loop = asyncio.get_running_loop()
+    addr = writer.get_extra_info('peername')
+    print(f"server_ai5.py: Connected to {addr}")
+
+    # Every connection gets its own conversation state
+    conversation_history = new_history()
+    response_count = 0
+
+    # Keep at most 64KiB queued per client; drain() then waits for slow readers
+    writer.transport.set_write_buffer_limits(high=64 * 1024)
+
+    try:
+        message = find_random_starting_response(responses_dict)
+        writer.write(encode_frame(clean_response(message)))
+        await writer.drain()
+
+        while True:
+            try:
+                response = await asyncio.wait_for(read_message_async(reader), read_timeout)
+            except asyncio.TimeoutError:
+                print(f"server_ai5.py: {addr} timed out")
+                break
+            if response is None:
+                break
+
+            response = clean_response(response)
+            print(f"{Fore.RED}[{Fore.RESET}>{Fore.RED}]: {GREEN}{response}")
+
+            # The turn's thread queues its chunks for a writer task on the
+            # loop, which sends them in order and waits on drain() after each,
+            # so a slow reader doesn't let the transport buffer grow
+            streamed = []
+            chunks = asyncio.Queue()
+
+            async def write_chunks():
+                while True:
+                    text = await chunks.get()
+                    if text is None:
+                        return
+                    writer.write(encode_frame(clean_response(text), CHUNK))
+                    await writer.drain()
+
+            def send_chunk(text):
+                streamed.append(text)
+                loop.call_soon_threadsafe(chunks.put_nowait, text)
+
+            chunk_writer = asyncio.ensure_future(write_chunks()) if stream_responses else None
+            try:
+                feedback = await loop.run_in_executor(
+                    turn_executor, run_turn, response, inputs_dict, responses_dict,
+                    conversation_history, fetch_executor, send_chunk if stream_responses else None)
+            except BaseException:
+                if chunk_writer:
+                    chunk_writer.cancel()
+                raise
+            if chunk_writer:
+                # Every chunk was queued before the turn's result came back
+                chunks.put_nowait(None)
+                await chunk_writer
+            if feedback is None:
+                continue
+
+            if prefetcher:
+                prefetcher.predict(predict_keywords(feedback))
+            with METRICS.span('send'):
+                if streamed:
+                    writer.write(encode_frame('', END))
+                else:
+                    writer.write(encode_frame(clean_response(feedback)))
+                await writer.drain()
+
+            response_count += 1
+            if response_count % 10 == 0:
+                create_backup()
+
+            if response.lower() in ['exit', 'quit']:
+                break
+    except (ConnectionError, ProtocolError, UnicodeDecodeError) as e:
+        print(f"Error from {addr}: {e}")
+    except asyncio.CancelledError:
+        pass
+    except Exception as e:
+        # A failed turn still tells the client why the connection ends
+        print(f"Error serving {addr}: {type(e).__name__}: {e}")
+        try:
+            writer.write(encode_frame(f"Server error: {type(e).__name__}", ERROR))
+            await writer.drain()
+        except ConnectionError:
+            pass
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        print(f"server_ai5.py: {addr} disconnected")
+
+async def run_async_server(host='localhost', port=5000, read_timeout=300,
+                           max_turns=32, shutdown_grace=10, reuse_port=False, follow_log=False):
+    # Opened before the load, so nothing appended in between gets lost
+    tailer = corpus_log.tail(None) if follow_log else None
+    inputs_dict, responses_dict = load_responses()
+    if tailer:
+        tailer.apply = lambda record: apply_record(record, inputs_dict, responses_dict)
+        tailer.start()
+    raise_open_file_limit()
+
+    # Turns run in threads so the event loop only ever waits on sockets.
+    # Fetches get their own pool, otherwise busy turns could starve them.
+    turn_executor = ThreadPoolExecutor(max_workers=max_turns)
+    fetch_executor = ThreadPoolExecutor(max_workers=10)
+    connections = set()
+
+    async def on_connect(reader, writer):
+        task = asyncio.current_task()
+        connections.add(task)
+        try:
+            await serve_connection(reader, writer, inputs_dict, responses_dict,
+                                   turn_executor, fetch_executor, read_timeout)
+        finally:
+            connections.discard(task)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    server = await asyncio.start_server(on_connect, host, port, backlog=1024, reuse_port=reuse_port)
+    print(f"server_ai5.py: Async server is running on {host}:{port} (pid {os.getpid()})...")
+
+    async with server:
+        await stop.wait()
+        print("server_ai5.py: Shutting down...")
+        server.close()
+        await server.wait_closed()
+
+        # Let in-flight turns finish, then drop whoever is still connected
+        if connections:
+            done, pending = await asyncio.wait(list(connections), timeout=shutdown_grace)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    turn_executor.shutdown(wait=True)
+    fetch_executor.shutdown(wait=True)
+    cache.close()
+    if sentence_store:
+        print(f"Sentence store: {sentence_store.stats()}")
+    if answer_cache:
+        print(f"Answer cache: {answer_cache.stats()}")
+    print(f"Memory: {GOVERNOR.stats()}")
+
+def start_async_server(read_timeout=300):
+    asyncio.run(run_async_server(read_timeout=read_timeout))
+
+def run_prefork_worker(number, records, args):
+    global cache, http_client, wiki_index, racer, input_index, corpus_writer, prefetcher
+    # Database handles, sockets and threads don't survive the fork; each
+    # worker opens its own and only shares the mapped corpus pages. The
+    # parent closed its SQLite handles before forking.
+    cache = FetchCache()
+    http_client = HttpClient.from_env()
+    wiki_index = WikiIndex.open_existing()
+    racer = SourceRacer(ThreadPoolExecutor(max_workers=8), budget=args.budget)
+    input_index = InvertedIndex(args.scoring)
+    corpus_writer = records
+
+    if args.metrics_port:
+        METRICS.serve(args.metrics_port + number)
+    if args.metrics_file:
+        METRICS.start_periodic_dump(f"{args.metrics_file}.{number}")
+    if args.prefetch:
+        prefetcher = PrefetchWorker(cache, [('wikipedia_sentences', fetch_wikipedia_sentences)])
+
+    configure_memory(args)  # the budget is per worker
+
+    asyncio.run(run_async_server(read_timeout=args.timeout, reuse_port=True, follow_log=True))
+
+def start_prefork_server(args):
+    # Workers map one binary corpus instead of each parsing a private copy.
+    # Compacting works from the snapshot and logs on disk; the corpus is
+    # only loaded here for a one-off import of legacy JSON files.
+    if not corpus_log.exists():
+        import_legacy_json()
+    corpus_log.compact(binary=True)
+
+    # A SQLite connection must not cross a fork, even unused
+    cache.close()
+    if wiki_index is not None:
+        wiki_index.close()
+
+    # Only the writer appends; workers pick new pairs up by tailing the log
+    records = CONTEXT.Queue()
+    writer = CONTEXT.Process(target=run_writer, args=(records, '.', os.getpid()), name='writer')
+    writer.start()
+    try:
+        Supervisor(run_prefork_worker, args.prefork, (records, args)).run()
+    finally:
+        records.put(None)
+        writer.join()
 
 def start_user_mode():
     inputs_dict, responses_dict = load_responses()
-    conversation_history = []
+    conversation_history = new_history()
+    executor = ThreadPoolExecutor(max_workers=10)
     
     if responses_dict:
         print("User mode activated. You can start typing your questions.")
@@ -300,26 +769,7 @@ def start_user_mode():
         response = input(f"{Fore.GREEN}[{Fore.RESET}<{Fore.GREEN}]: ")
         response = clean_response(response)
 
-        if response.lower() == "run programming console":
-            print("Running programming console...")
-            subprocess.run(["sudo", "bash", "use_coder.sh"], check=True)
-            continue
-        
-        if response.lower() == "backup":
-            create_backup()
-            print("Backup created in 'killme' folder.")
-            continue
-
-        if response.lower() == "show functions":
-            functions = list_functions()
-            print("Available functions:")
-            for i, func in enumerate(functions, 1):
-                print(f"{i}. {func}")
-            
-            selected = int(input("Select a function to show: ")) - 1
-            if 0 <= selected < len(functions):
-                function_code = show_function_code(functions[selected])
-                print(f"Code for {functions[selected]}:\n{function_code}")
+        if handle_command(response):
             continue
 
         best_match = best_match_response(response, inputs_dict)
@@ -330,8 +780,7 @@ def start_user_mode():
             input_words = response.split()
             all_relevant_sentences = []
 
-            with ThreadPoolExecutor(max_workers=10) as executor:
-                results = list(executor.map(fetch_wikipedia_sentences, input_words))
+            results = fetch_all_sentences(input_words, executor)
 
             for sentences in results:
                 all_relevant_sentences.extend(sentences)
@@ -377,9 +826,66 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser(description='Run server or user mode.')
     parser.add_argument('-u', action='store_true', help='Activate user input mode')
+    parser.add_argument('-a', action='store_true',
+                        help='Serve many clients at once with the asyncio server')
+    parser.add_argument('--sentence-store', type=int, default=DEFAULT_MAX_SENTENCES, metavar='N',
+                        help='Fetched sentences kept for multi-keyword answers; 0 disables '
+                             f'(default: {DEFAULT_MAX_SENTENCES})')
+    parser.add_argument('--answer-cache', type=int, default=DEFAULT_ENTRIES, metavar='N',
+                        help=f'Whole answers remembered by normalized question; 0 disables (default: {DEFAULT_ENTRIES})')
+    parser.add_argument('--answer-ttl', type=float, default=DEFAULT_TTL, metavar='SECONDS',
+                        help=f'How long a remembered answer stays fresh (default: {DEFAULT_TTL})')
+    parser.add_argument('--snapshot-interval', type=float, default=300, metavar='SECONDS',
+                        help=f'Minimum time between corpus backups in {BACKUP_DIR}/; 0 only backs up '
+                             'on the "backup" command (default: 300)')
+    parser.add_argument('--stream', action='store_true',
+                        help='Send the first answer sentence as soon as it is ready, the rest as it follows')
+    parser.add_argument('--prefork', type=int, metavar='N',
+                        help='Run N async server processes sharing port 5000 (SO_REUSEPORT)')
+    parser.add_argument('--timeout', type=float, default=300,
+                        help='Seconds an async connection may stay silent (default: 300)')
+    parser.add_argument('--prefetch', action='store_true',
+                        help='Warm the fetch cache for the likely next keywords in the background')
+    add_metrics_arguments(parser)
+    add_memory_arguments(parser)
+    parser.add_argument('--scoring', choices=SCORING_MODES, default='count',
+                        help='Ranking used by best_match_response (default: match count)')
+    parser.add_argument('--budget', type=float, default=3.0,
+                        help='Seconds a turn waits for slow sources (default: 3)')
+    parser.add_argument('--parse-workers', type=int,
+                        help='Processes parsing fetched articles; 0 parses in the fetch threads '
+                             '(default: one per CPU but one)')
+    parser.add_argument('--history-window', type=int, default=DEFAULT_WINDOW,
+                        help=f'Responses remembered for repeat suppression (default: {DEFAULT_WINDOW})')
+    parser.add_argument('--history-threshold', type=parse_threshold, default=DEFAULT_THRESHOLD,
+                        help='SimHash bits a near-duplicate may differ in; -1 only rejects exact repeats '
+                             f'(default: {DEFAULT_THRESHOLD})')
     args = parser.parse_args()
 
+    input_index.scoring = args.scoring
+    history_window = args.history_window
+    history_threshold = args.history_threshold
+    stream_responses = args.stream
+    racer.budget = args.budget
+    snapshots.interval = args.snapshot_interval
+    sentence_store = SentenceStore(args.sentence_store) if args.sentence_store else None
+    answer_cache = (AnswerCache(args.answer_cache, args.answer_ttl,
+                                keep=lambda answer: answer != FALLBACK_FEEDBACK)
+                    if args.answer_cache else None)
+    if args.prefork:
+        # Forked before any pool or thread exists; the workers are the
+        # parallelism here, so each one parses inline and sets up its own metrics
+        start_prefork_server(args)
+        raise SystemExit
+    parse_pool = ParsePool(args.parse_workers).start()
+    configure_metrics(args)
+    configure_memory(args)
+    if args.prefetch:
+        prefetcher = PrefetchWorker(cache, [('wikipedia_sentences', fetch_wikipedia_sentences)])
+
     if args.u:
         start_user_mode()
+    elif args.a:
+        start_async_server(read_timeout=args.timeout)
     else:
         start_server()
@@ -0,0 +1,157 @@
+import time
+import threading
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+
+class SourceRacer:
+    # Runs one turn's fetches against a latency budget. Results are handed to
+    # on_result as they complete, and the turn returns as soon as good_enough()
+    # says so or the budget runs out. Fetches not yet started are cancelled;
+    # ones already running finish into the fetch cache for later turns.
+    #
+    # Per-source latencies decide two things. A source whose median is over
+    # the budget is skipped, but for a single background probe at a time so
+    # its latency can recover. A call still running past its source's p90
+    # gets a hedged duplicate, and whichever copy finishes first is used.
+    # Every turn shares the racer, so a turn's own calls are always made; a
+    # hedge is only added while its source has fewer than 'max_in_flight'
+    # calls queued or running, so duplicates don't pile up behind a stall.
+    def __init__(self, executor, budget=2.0, window=50, min_samples=5, hedge_quantile=90,
+                 hedge_floor=0.25, max_in_flight=16):
+        self.executor = executor
+        self.budget = budget
+        self.window = window
+        self.min_samples = min_samples
+        self.hedge_quantile = hedge_quantile
+        self.hedge_floor = hedge_floor  # cache hits make p90 tiny; never hedge before this
+        self.max_in_flight = max_in_flight
+        self.latencies = {}   # source -> recent call durations in seconds
+        self.in_flight = Counter()  # source -> calls submitted and not done
+        self.lock = threading.Lock()
+        self.metrics = Counter()
+
+    def _count(self, name, n=1):
+        with self.lock:
+            self.metrics[name] += n
+
+    def _submit(self, executor, source, fetch, arg, limit=None):
+        # None when the source already has 'limit' calls queued or running
+        with self.lock:
+            if limit is not None and self.in_flight[source] >= limit:
+                self.metrics["throttled"] += 1
+                return None
+            self.in_flight[source] += 1
+        future = executor.submit(self._call, source, fetch, arg)
+        future.add_done_callback(lambda f: self._done(source))
+        return future
+
+    def _done(self, source):
+        with self.lock:
+            self.in_flight[source] -= 1
+
+    def _call(self, source, fetch, arg):
+        start = time.monotonic()
+        try:
+            return fetch(arg)
+        except Exception as e:
+            print(f"{source} fetch of {arg} failed: {e}")
+            return []
+        finally:
+            self.observe(source, time.monotonic() - start)
+
+    def observe(self, source, seconds):
+        with self.lock:
+            samples = self.latencies.get(source)
+            if samples is None:
+                samples = self.latencies[source] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def latency(self, source, quantile=50):
+        with self.lock:
+            samples = sorted(self.latencies.get(source, ()))
+        if len(samples) < self.min_samples:
+            return None
+        return samples[min(len(samples) - 1, len(samples) * quantile // 100)]
+
+    def is_slow(self, source, budget=None):
+        median = self.latency(source)
+        return median is not None and median > (self.budget if budget is None else budget)
+
+    def race(self, calls, on_result, good_enough=None, budget=None, executor=None):
+        # calls: (source, fetch function, argument) triples
+        budget = self.budget if budget is None else budget
+        executor = executor or self.executor
+        deadline = time.monotonic() + budget
+        running = {}   # future -> call number
+        started = {}   # call number -> (start time, hedged)
+
+        slow = [self.is_slow(source, budget) for source, _, _ in calls]
+        if all(slow):
+            slow = [False] * len(calls)  # waiting on slow sources beats answering with nothing
+
+        for number, (source, fetch, arg) in enumerate(calls):
+            if slow[number]:
+                # Not waited for; one probe at a time keeps its latency current
+                self._count("skipped_slow")
+                self._submit(executor, source, fetch, arg, limit=1)
+                continue
+            future = self._submit(executor, source, fetch, arg)
+            running[future] = number
+            started[number] = (time.monotonic(), False)
+
+        finished = set()
+        while running:
+            if good_enough is not None and good_enough():
+                self._count("early_returns")
+                break
+            now = time.monotonic()
+            if now >= deadline:
+                self._count("deadline_hits")
+                break
+
+            timeout = deadline - now
+            for number, (start, hedged) in started.items():
+                if number in finished or hedged:
+                    continue
+                hedge_after = self.latency(calls[number][0], self.hedge_quantile)
+                if hedge_after is None:
+                    continue
+                hedge_after = max(hedge_after, self.hedge_floor)
+                if now - start >= hedge_after:
+                    source, fetch, arg = calls[number]
+                    started[number] = (start, True)
+                    future = self._submit(executor, source, fetch, arg, limit=self.max_in_flight)
+                    if future is not None:
+                        running[future] = number
+                        self._count("hedged")
+                else:
+                    timeout = min(timeout, start + hedge_after - now)
+
+            done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+            for future in done:
+                number = running.pop(future, None)
+                if number is None or number in finished:
+                    continue
+                finished.add(number)
+                # Drop the other copy of a hedged call
+                for other in [f for f, n in running.items() if n == number]:
+                    del running[other]
+                    other.cancel()
+                source, _, arg = calls[number]
+                on_result(number, source, arg, future.result())
+
+        # Calls still queued are dropped; running ones finish into the cache
+        for future in running:
+            future.cancel()
+        self._count("abandoned", len(set(running.values())))
+        return len(finished)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.metrics)
+        for source in list(self.latencies):
+            median = self.latency(source)
+            if median is not None:
+                stats[f"{source}_p50_ms"] = round(median * 1000, 1)
+        return stats
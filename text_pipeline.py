@@ -0,0 +1,124 @@
+import re
+from functools import lru_cache
+
+# Compiled once at import instead of being looked up on every sentence
+REFERENCE_DIGITS = re.compile(r'\s*[\d+]')
+CITATION = re.compile(r'\s*\[\d+\]')
+WHITESPACE = re.compile(r'\s+')
+SENTENCE_END = re.compile(r'(?<=[.!?]) +')
+WORD = re.compile(r'\b\w+\b')
+
+STOPWORDS = {"it", "to", "so", "a", "the", "about", "is", "of", "in", "on"}
+QUESTION_WORDS = {"what", "where", "when", "why", "how", "who", "which", "tell", "explain", "describe"}
+
+
+def clean_response(response):
+    return REFERENCE_DIGITS.sub('', response).strip()
+
+
+def split_sentences(text):
+    return SENTENCE_END.split(text)
+
+
+def extract_sentences(paragraphs, word, limit=5):
+    filtered_sentences = []
+    for paragraph in paragraphs:
+        for sentence in split_sentences(paragraph):
+            if word.lower() in sentence.lower():
+                sentence = clean_response(sentence)
+                if sentence.endswith('.') and not sentence.endswith(':'):
+                    filtered_sentences.append(sentence)
+        # The rest of the article can't change the first 'limit' matches
+        if len(filtered_sentences) >= limit:
+            break
+    return filtered_sentences[:limit]
+
+
+def article_paragraphs(paragraphs, word=None):
+    # The whole article, for the sentence store; the per-word filters
+    # give the same result when run over this list afterwards
+    return list(paragraphs)
+
+
+def content_words(text):
+    return [w for w in WORD.findall(text.lower()) if w not in STOPWORDS and len(w) > 2]
+
+
+@lru_cache(maxsize=1024)
+def meaningless_pattern(keyword):
+    keyword = re.escape(keyword)
+    return re.compile(rf'^{keyword}[,\s]*(?:{keyword}[,\s]*)+or {keyword}$', re.I)
+
+
+def is_meaningless(sentence, keyword):
+    if meaningless_pattern(keyword).match(sentence):
+        return True
+    return len(sentence.split()) < 5 or sentence.count(' ') < 3
+
+
+def clean_sentence(sentence):
+    return WHITESPACE.sub(' ', CITATION.sub('', sentence.strip()))
+
+
+def process_sentences(sentences, keyword):
+    filtered = []
+    lowered_keyword = keyword.lower()
+    pattern = meaningless_pattern(keyword)
+    for s in sentences:
+        s = clean_sentence(s)
+        if (s and s[0].isupper() and s.endswith('.')
+                and not pattern.match(s)
+                and len(s.split()) >= 5 and s.count(' ') >= 3
+                and lowered_keyword in s.lower()):
+            filtered.append(s)
+            if len(filtered) == 10:
+                break
+    return filtered
+
+
+def extract_wikipedia(paragraphs, word, limit=10):
+    processed = []
+    for paragraph in paragraphs:
+        processed.extend(process_sentences([paragraph], word))
+        if len(processed) >= limit:
+            break
+    return processed[:limit]
+
+
+def score_words(words, keyword):
+    try:
+        pos = words.index(keyword)
+    except ValueError:
+        return 0
+
+    position_score = 1.5 - (pos / len(words))
+    starts_with = 3 if words[0] == keyword else 0
+    length_score = min(len(words)/30, 1)
+    return position_score + starts_with + length_score
+
+
+def score_sentence(sentence, keyword):
+    return score_words(sentence.lower().split(), keyword.lower())
+
+
+def score_sentences(sentences, keywords):
+    # One lower()/split() per sentence, shared by every keyword. Yields the
+    # same (score, sentence) pairs, in the same order, as calling
+    # score_sentence for each keyword found in each sentence.
+    keywords = [kw.lower() for kw in keywords]
+    scored = []
+    for s in sentences:
+        lowered = s.lower()
+        words = None
+        for kw in keywords:
+            if kw in lowered:
+                if words is None:
+                    words = lowered.split()
+                scored.append((score_words(words, kw), s))
+    return scored
+
+
+def rank_sentences(scored):
+    # Highest score first; a sentence keeps the position of its best score
+    scored = sorted(scored, reverse=True, key=lambda x: x[0])
+    return list(dict.fromkeys(s for _, s in scored if s.strip()))
@@ -0,0 +1,257 @@
+import os
+import re
+import bz2
+import html
+import json
+import time
+import sqlite3
+import argparse
+import functools
+import threading
+import multiprocessing
+import xml.etree.ElementTree as ET
+from collections import deque
+
+from text_pipeline import WHITESPACE
+
+INDEX_FILE = 'wiki_index.db'
+FORMAT = '2'  # articles keyed by exact title, stored as raw paragraphs
+
+COMMENT = re.compile(r'<!--.*?-->', re.DOTALL)
+REF = re.compile(r'<ref[^>/]*/>|<ref[^>]*>.*?</ref>', re.DOTALL | re.IGNORECASE)
+TEMPLATE = re.compile(r'\{\{[^{}]*\}\}')
+TABLE = re.compile(r'\{\|[^{}]*?\|\}', re.DOTALL)
+FILE_LINK = re.compile(r'\[\[(?:File|Image|Category):[^\[\]]*(?:\[\[[^\]]*\]\][^\[\]]*)*\]\]', re.IGNORECASE)
+LINK = re.compile(r'\[\[(?:[^|\]]*\|)?([^\]]*)\]\]')
+EXTERNAL_LINK = re.compile(r'\[https?://\S+\s*([^\]]*)\]')
+EMPHASIS = re.compile(r"'{2,}")
+TAG = re.compile(r'<[^>]+>')
+NOT_PROSE = ('=', '*', '#', ':', ';', '|', '!', '{', '}')
+
+
+def strip_wikitext(text):
+    text = COMMENT.sub('', text)
+    text = REF.sub('', text)
+    # Templates and tables nest; peel them from the inside out
+    for pattern in (TEMPLATE, TABLE):
+        for _ in range(10):
+            text, count = pattern.subn('', text)
+            if not count:
+                break
+    text = FILE_LINK.sub('', text)
+    text = LINK.sub(r'\1', text)
+    text = EXTERNAL_LINK.sub(r'\1', text)
+    text = EMPHASIS.sub('', text)
+    text = html.unescape(TAG.sub('', text))
+    return [WHITESPACE.sub(' ', line).strip() for line in text.splitlines()
+            if line.strip() and not line.lstrip().startswith(NOT_PROSE)]
+
+
+def article_paragraphs(page, max_paragraphs=40):
+    # The article's prose as the online fetchers see it, one paragraph per
+    # entry; they run the same per-word extraction over it on lookup.
+    # Runs in the pool.
+    title, text = page
+    return title, strip_wikitext(text)[:max_paragraphs]
+
+
+def iter_pages(path):
+    # Streams (title, text, redirect) out of a pages-articles dump; every
+    # finished page is cleared, so memory stays flat for any dump size.
+    opener = bz2.open if path.endswith('.bz2') else open
+    with opener(path, 'rb') as f:
+        context = ET.iterparse(f, events=('start', 'end'))
+        _, root = next(context)
+        namespace = root.tag[:root.tag.index('}') + 1] if root.tag.startswith('{') else ''
+        for event, elem in context:
+            if event != 'end' or elem.tag != namespace + 'page':
+                continue
+            if elem.findtext(namespace + 'ns') == '0':
+                redirect = elem.find(namespace + 'redirect')
+                yield (elem.findtext(namespace + 'title') or '',
+                       elem.findtext(f'{namespace}revision/{namespace}text') or '',
+                       redirect.get('title') if redirect is not None else None)
+            else:
+                yield None
+            root.clear()
+
+
+class WikiIndex:
+    def __init__(self, path=INDEX_FILE, readonly=False):
+        self.path = path
+        self.lock = threading.Lock()
+        if readonly:
+            self.db = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        else:
+            self.db = sqlite3.connect(path, check_same_thread=False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            # Titles are case sensitive past the first letter ("Nasa", "NASA");
+            # 'keyword' is the lowercased title lookups start from
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS articles (
+                    title TEXT PRIMARY KEY,
+                    keyword TEXT NOT NULL,
+                    paragraphs TEXT NOT NULL
+                ) WITHOUT ROWID""")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS title_redirects (
+                    title TEXT PRIMARY KEY,
+                    keyword TEXT NOT NULL,
+                    target TEXT NOT NULL
+                ) WITHOUT ROWID""")
+            self.db.execute("CREATE INDEX IF NOT EXISTS articles_keyword ON articles (keyword)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS title_redirects_keyword ON title_redirects (keyword)")
+            self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            self.db.commit()
+        self.complete = self.meta('complete') == '1'
+
+    @classmethod
+    def open_existing(cls, path=INDEX_FILE):
+        # The fetchers only use an index somebody has ingested
+        if not os.path.exists(path):
+            return None
+        try:
+            index = cls(path, readonly=True)
+        except sqlite3.Error as e:
+            print(f"Ignoring {path}: {e}")
+            return None
+        if index.meta('format') != FORMAT:
+            print(f"Ignoring {path}: built by an older wiki_dump.py; rerun it with --restart")
+            index.close()
+            return None
+        return index
+
+    def meta(self, name, default=None):
+        try:
+            row = self.db.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+        except sqlite3.OperationalError:
+            return default
+        return row[0] if row else default
+
+    def _find(self, table, column, word):
+        # The exact title, then the one the online fetchers would request,
+        # then any title differing only in case
+        return self.db.execute(
+            f"SELECT {column} FROM {table} WHERE keyword = ? ORDER BY title = ? DESC, title = ? DESC LIMIT 1",
+            (word.lower(), word, word.capitalize())).fetchone()
+
+    def lookup(self, word):
+        # Paragraphs of the article for 'word', [] when a complete dump has
+        # no such article, None when the index can't tell and the network
+        # should decide.
+        try:
+            with self.lock:
+                row = self._find('articles', 'paragraphs', word)
+                if row is None:
+                    target = self._find('title_redirects', 'target', word)
+                    if target is not None:
+                        row = self.db.execute("SELECT paragraphs FROM articles WHERE title = ?",
+                                              target).fetchone()
+        except sqlite3.Error as e:
+            print(f"Wiki index error: {e}")
+            return None
+        if row is not None:
+            return json.loads(row[0])
+        return [] if self.complete else None
+
+    def close(self):
+        self.db.close()
+
+
+def ingest(dump_path, index_path=INDEX_FILE, workers=None, batch_size=200, max_paragraphs=40,
+           restart=False, report_every=5.0):
+    index = WikiIndex(index_path)
+    db = index.db
+    dump_id = f"{os.path.abspath(dump_path)}:{os.path.getsize(dump_path)}"
+    if restart or index.meta('dump') != dump_id or index.meta('format') != FORMAT:
+        if index.meta('dump') not in (None, dump_id) and not restart:
+            raise SystemExit(f"{index_path} was built from another dump; pass --restart to rebuild it")
+        with db:
+            # Tables of the sentence-per-keyword format before FORMAT 2
+            db.execute("DROP TABLE IF EXISTS sentences")
+            db.execute("DROP TABLE IF EXISTS redirects")
+            db.execute("DELETE FROM articles")
+            db.execute("DELETE FROM title_redirects")
+            db.execute("DELETE FROM meta")
+            db.execute("INSERT INTO meta VALUES ('dump', ?)", (dump_id,))
+            db.execute("INSERT INTO meta VALUES ('format', ?)", (FORMAT,))
+
+    # Pages are counted in dump order, so a rerun skips what was committed
+    done = int(index.meta('pages', 0))
+    if done:
+        print(f"Resuming after {done} pages")
+
+    started = time.monotonic()
+    last_report = started
+    processed = articles = 0
+    pending = deque()
+
+    def write(count, redirects, result):
+        nonlocal done, articles
+        rows = [(title, title.lower(), json.dumps(paragraphs))
+                for title, paragraphs in result.get() if paragraphs]
+        with db:
+            db.executemany("INSERT OR REPLACE INTO articles VALUES (?, ?, ?)", rows)
+            db.executemany("INSERT OR REPLACE INTO title_redirects VALUES (?, ?, ?)", redirects)
+            done += count
+            db.execute("INSERT OR REPLACE INTO meta VALUES ('pages', ?)", (str(done),))
+        articles += len(rows)
+
+    extract = functools.partial(article_paragraphs, max_paragraphs=max_paragraphs)
+    with multiprocessing.Pool(workers) as pool:
+        # A bounded number of batches in flight keeps parsing and the pool
+        # busy at the same time without queueing the whole dump in memory.
+        max_pending = 2 * (workers or os.cpu_count() or 1)
+        batch, redirects, count = [], [], 0
+        for position, page in enumerate(iter_pages(dump_path)):
+            if position < done:
+                continue
+            count += 1
+            if page is not None:
+                title, text, redirect = page
+                if redirect:
+                    redirects.append((title, title.lower(), redirect))
+                elif text:
+                    batch.append((title, text))
+
+            if count == batch_size:
+                pending.append((count, redirects, pool.map_async(extract, batch, chunksize=16)))
+                processed += count
+                batch, redirects, count = [], [], 0
+                while len(pending) >= max_pending:
+                    write(*pending.popleft())
+
+            now = time.monotonic()
+            if now - last_report >= report_every:
+                print(f"{processed} pages, {processed / (now - started):.0f} pages/sec, "
+                      f"{articles} articles indexed")
+                last_report = now
+
+        pending.append((count, redirects, pool.map_async(extract, batch, chunksize=16)))
+        processed += count
+        while pending:
+            write(*pending.popleft())
+
+    with db:
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '1')")
+    elapsed = time.monotonic() - started
+    print(f"Done: {processed} pages in {elapsed:.0f}s ({processed / elapsed if elapsed else 0:.0f} pages/sec), "
+          f"{articles} articles indexed into {index_path}")
+    index.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Index a local Wikipedia pages-articles dump (.xml.bz2) for offline lookups.')
+    parser.add_argument('dump', help='e.g. enwiki-latest-pages-articles.xml.bz2')
+    parser.add_argument('--index', default=INDEX_FILE, help=f'Index database (default: {INDEX_FILE})')
+    parser.add_argument('--workers', type=int, help='Parser processes (default: one per CPU)')
+    parser.add_argument('--batch', type=int, default=200, help='Pages per batch and commit')
+    parser.add_argument('--max-paragraphs', type=int, default=40,
+                        help='Paragraphs kept per article (default: 40)')
+    parser.add_argument('--restart', action='store_true', help='Drop the existing index and start over')
+    args = parser.parse_args()
+
+    ingest(args.dump, args.index, workers=args.workers, batch_size=args.batch,
+           max_paragraphs=args.max_paragraphs, restart=args.restart)